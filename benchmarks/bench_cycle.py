@@ -0,0 +1,176 @@
+"""Benchmark auto-ack cycles against the in-process fake PagerDuty server.
+
+Builds the same clients and pollers as ``pagerduty-auto-ack`` does, retriggers the whole
+seeded storm before every cycle and reports cycle latency, API requests per cycle,
+incidents per second and peak RSS::
+
+    poetry run python -m benchmarks.bench_cycle --incidents 2000 --users 4 --cycles 5
+"""
+
+import argparse
+import asyncio
+import logging
+import math
+import resource
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pagerduty_auto_ack import cli, metrics
+
+from .fake_pagerduty import SCHEDULE_ID, FakePagerDuty
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--incidents", type=int, default=1000, help="triggered incidents to seed")
+    parser.add_argument("--users", type=int, default=1, help="users, each with its own API key and poller")
+    parser.add_argument("--oncalls", type=int, default=1, help="on-call shifts per user (0: no schedule check)")
+    parser.add_argument("--cycles", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.0, help="added server latency per request, in ms")
+    parser.add_argument("--action", choices=["ack", "resolve"], action="append", help="repeat to run both")
+    parser.add_argument("--update-concurrency", type=int, default=cli.DEFAULTS["update_concurrency"])
+    parser.add_argument("--workers", type=int, default=cli.DEFAULTS["workers"])
+    parser.add_argument("--shards", type=int, default=1, help="partitions per user, each with its own poller")
+    parser.add_argument("--shard-by", choices=["service", "team"], default="service")
+    parser.add_argument(
+        "--requests-per-minute",
+        type=int,
+        default=10**9,
+        help="client-side rate limit (default: effectively off, to measure the client itself)",
+    )
+    parser.add_argument("--async", action="store_true", dest="use_async")
+    parser.add_argument("--verbose", action="store_true", help="keep the daemon's INFO logging")
+    return parser.parse_args()
+
+
+def make_config(args, url: str) -> tuple[dict, list]:
+    cfg = dict(cli.DEFAULTS)
+    cfg.update(
+        api_url=url,
+        action=args.action or "ack",
+        update_concurrency=args.update_concurrency,
+        workers=args.workers,
+        shards=args.shards,
+        shard_by=args.shard_by,
+        requests_per_minute=args.requests_per_minute,
+        schedule_id=SCHEDULE_ID if args.oncalls else None,
+        # every cycle replays the same incidents on purpose
+        recent_ttl=0,
+        users=[{"pagerduty_api_key": f"key{n}"} for n in range(args.users)],
+    )
+    return cfg, cli.user_configs(cfg)
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def run_sync(cfg: dict, user_cfgs: list, histories: list, fake: FakePagerDuty, cycles: int) -> list:
+    clients = cli.make_clients(cfg, user_cfgs)
+    pool = ThreadPoolExecutor(max_workers=cfg["workers"])
+    try:
+        pollers = cli.start_pollers(user_cfgs, clients, histories)
+        results = []
+        for _ in range(cycles):
+            fake.retrigger()
+            before = snapshot(fake, histories)
+            list(pool.map(lambda p: p.cycle(), pollers))
+            results.append(since(before, fake, histories))
+        return results
+    finally:
+        pool.shutdown()
+        for client in clients:
+            client.close()
+
+
+async def run_async(cfg: dict, user_cfgs: list, histories: list, fake: FakePagerDuty, cycles: int) -> list:
+    connector, clients, ratelimits = cli.make_async_clients(cfg, user_cfgs)
+    try:
+        pollers = await cli.start_async_pollers(user_cfgs, clients, ratelimits, histories)
+        results = []
+        for _ in range(cycles):
+            fake.retrigger()
+            before = snapshot(fake, histories)
+            await asyncio.gather(*(p.cycle() for p in pollers))
+            results.append(since(before, fake, histories))
+        return results
+    finally:
+        for client in clients:
+            await client.close()
+        await connector.close()
+
+
+def snapshot(fake: FakePagerDuty, histories: list) -> tuple:
+    return (
+        time.perf_counter(),
+        fake.request_count(),
+        sum(len(h) for hs in histories for h in hs.values()),
+        metrics.HTTP_CONNECTIONS.total(),
+        metrics.HTTP_CONNECT_SECONDS.totals()[1],
+    )
+
+
+def since(before: tuple, fake: FakePagerDuty, histories: list) -> tuple:
+    """(seconds, requests, incidents handled, connections opened, seconds spent connecting) since ``before``."""
+    now = snapshot(fake, histories)
+    return tuple(b - a for a, b in zip(before, now))
+
+
+def report(results: list):
+    latencies = [r[0] for r in results]
+    for n, (elapsed, requests, handled, connections, _) in enumerate(results, 1):
+        print(
+            f"cycle {n:3d}: {elapsed * 1000:9.1f} ms  {requests:6d} requests"
+            f"  {connections:4g} new connections  {handled:7d} incidents"
+        )
+
+    total_time = sum(latencies)
+    total_handled = sum(r[2] for r in results)
+    p95 = sorted(latencies)[math.ceil(0.95 * len(latencies)) - 1]
+    print("─" * 60)
+    print(f"cycle latency   median {statistics.median(latencies) * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms")
+    print(f"requests/cycle  {statistics.mean(r[1] for r in results):.1f}")
+    connections = sum(r[3] for r in results)
+    if connections:
+        # Every reused connection skipped a handshake of about the average measured one
+        handshake = sum(r[4] for r in results) / connections
+        reused = sum(r[1] for r in results) - connections
+        print(f"connections     {connections / len(results):.1f} new/cycle, {handshake * 1000:.2f} ms per handshake")
+        print(f"handshakes      {reused * handshake * 1000 / len(results):.1f} ms/cycle saved by reusing connections")
+    print(f"incidents/sec   {total_handled / total_time:.0f}")
+    print(f"peak RSS        {peak_rss_mb():.1f} MB")
+
+
+def main():
+    args = parse_args()
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    fake = FakePagerDuty(incidents=args.incidents, users=args.users, oncalls=args.oncalls, latency=args.latency / 1000)
+    url = fake.start()
+    cfg, user_cfgs = make_config(args, url)
+    histories = cli.make_histories(user_cfgs)
+    try:
+        if args.use_async:
+            results = asyncio.run(run_async(cfg, user_cfgs, histories, fake, args.cycles))
+        else:
+            results = run_sync(cfg, user_cfgs, histories, fake, args.cycles)
+    finally:
+        for user_histories in histories:
+            for history in user_histories.values():
+                history.close()
+        fake.stop()
+
+    print(
+        f"{args.incidents} incidents, {args.users} users, {args.oncalls} on-calls/user,"
+        f" {args.shards} shards/user, {args.latency:g} ms latency, {'async' if args.use_async else 'sync'}"
+    )
+    report(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""In-process stand-in for the parts of the PagerDuty REST API the daemon uses.
+
+Serves ``GET /users/me``, ``GET /incidents``, ``PUT /incidents`` and ``GET /oncalls`` from
+memory with classic pagination and the same filters as the real API, and counts the
+requests it receives per endpoint.
+"""
+
+import json
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+SCHEDULE_ID = "PSCHED1"
+
+
+def _iso(dt: datetime) -> str:
+    return dt.isoformat().replace("+00:00", "Z")
+
+
+def _parse(value: str | None) -> datetime | None:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _time(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+class FakePagerDuty:
+    def __init__(self, incidents: int = 1000, users: int = 1, oncalls: int = 1, latency: float = 0.0):
+        """Seed ``incidents`` triggered incidents spread round-robin over ``users`` users.
+
+        Every user gets ``oncalls`` on-call shifts on :data:`SCHEDULE_ID`, the first one
+        covering now. ``latency`` seconds are added to every response.
+        """
+        self.latency = latency
+        self.users = [
+            {"id": f"PUSER{n:03d}", "type": "user", "email": f"user{n}@example.com", "name": f"User {n}"}
+            for n in range(users)
+        ]
+        self.tokens = {f"Token token=key{n}": user for n, user in enumerate(self.users)}
+
+        now = datetime.now(timezone.utc)
+        self.oncalls: list[dict] = [
+            {
+                "user": {"id": user["id"], "type": "user_reference"},
+                "schedule": {"id": SCHEDULE_ID, "type": "schedule_reference"},
+                "start": _iso(now - timedelta(hours=1) + timedelta(hours=12 * k)),
+                "end": _iso(now + timedelta(hours=7) + timedelta(hours=12 * k)),
+            }
+            for user in self.users
+            for k in range(oncalls)
+        ]
+
+        self.incidents: list[dict] = [
+            {
+                "id": f"PINC{n:06d}",
+                "type": "incident",
+                "incident_number": n,
+                "title": f"Incident {n}",
+                "status": "triggered",
+                "urgency": "high" if n % 2 else "low",
+                "created_at": _iso(now - timedelta(seconds=n % 600)),
+                "service": {"id": f"PSVC{n % 10:03d}", "type": "service_reference"},
+                "teams": [{"id": f"PTEAM{n % 3}", "type": "team_reference"}],
+                "priority": {"id": f"PPRIO{n % 5 + 1}", "type": "priority", "summary": f"P{n % 5 + 1}"},
+                "assignments": [{"assignee": {"id": self.users[n % users]["id"], "type": "user_reference"}}],
+            }
+            for n in range(incidents, 0, -1)
+        ]
+        self.by_id = {incident["id"]: incident for incident in self.incidents}
+        self.services = [{"id": f"PSVC{n:03d}", "type": "service", "name": f"Service {n}"} for n in range(10)]
+        self.teams = [{"id": f"PTEAM{n}", "type": "team", "name": f"Team {n}"} for n in range(3)]
+        self.requests: Counter[str] = Counter()
+        self._failures: list[int] = []
+        self._lock = threading.Lock()
+        self._server: ThreadingHTTPServer | None = None
+
+    @property
+    def url(self) -> str:
+        assert self._server is not None, "not started"
+        host, port = self._server.server_address[:2]
+        return f"http://{host!s}:{port}"
+
+    def start(self) -> str:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self._server = server
+        return self.url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def retrigger(self):
+        """Put every incident back to triggered, to replay the same storm."""
+        with self._lock:
+            for incident in self.incidents:
+                incident["status"] = "triggered"
+
+    def fail(self, count: int = 1, status: int = 502):
+        """Answer the next ``count`` authorized requests with ``status``, to simulate an outage."""
+        with self._lock:
+            self._failures += [status] * count
+
+    def request_count(self) -> int:
+        with self._lock:
+            return sum(self.requests.values())
+
+    def _page(self, items: list, query: dict, wrapper: str) -> dict:
+        limit = int(query.get("limit", ["25"])[0])
+        offset = int(query.get("offset", ["0"])[0])
+        body = {wrapper: items[offset : offset + limit], "limit": limit, "offset": offset}
+        body["more"] = offset + limit < len(items)
+        if query.get("total", ["false"])[0] in ("true", "1"):
+            body["total"] = len(items)
+        return body
+
+    def list_incidents(self, query: dict) -> dict:
+        user_ids = set(query.get("user_ids[]", []))
+        statuses = set(query.get("statuses[]", []))
+        urgencies = set(query.get("urgencies[]", []))
+        service_ids = set(query.get("service_ids[]", []))
+        team_ids = set(query.get("team_ids[]", []))
+        since = _parse(query.get("since", [None])[0])
+        with self._lock:
+            matching = [
+                i
+                for i in self.incidents
+                if (not statuses or i["status"] in statuses)
+                and (not urgencies or i["urgency"] in urgencies)
+                and (not service_ids or i["service"]["id"] in service_ids)
+                and (not team_ids or any(t["id"] in team_ids for t in i["teams"]))
+                and (not user_ids or i["assignments"][0]["assignee"]["id"] in user_ids)
+                and (since is None or _time(i["created_at"]) >= since)
+            ]
+        sort_by = query.get("sort_by", [""])[0]
+        if sort_by == "incident_number:asc":
+            matching.reverse()
+        elif sort_by.startswith("created_at"):
+            matching.sort(key=lambda i: i["created_at"], reverse=sort_by.endswith(":desc"))
+        return self._page(matching, query, "incidents")
+
+    def update_incidents(self, body: dict) -> dict:
+        updated = []
+        with self._lock:
+            for ref in body.get("incidents", []):
+                incident = self.by_id.get(ref["id"])
+                if incident is not None:
+                    incident["status"] = ref["status"]
+                    updated.append(incident)
+        return {"incidents": updated}
+
+    def list_oncalls(self, query: dict) -> dict:
+        user_ids = set(query.get("user_ids[]", []))
+        schedule_ids = set(query.get("schedule_ids[]", []))
+        since = _parse(query.get("since", [None])[0]) or datetime.now(timezone.utc)
+        until = _parse(query.get("until", [None])[0]) or since
+        matching = [
+            o
+            for o in self.oncalls
+            if (not user_ids or o["user"]["id"] in user_ids)
+            and (not schedule_ids or o["schedule"]["id"] in schedule_ids)
+            and _time(o["start"]) <= until
+            and _time(o["end"]) > since
+        ]
+        return self._page(matching, query, "oncalls")
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self, status: int, body: dict):
+                if fake.latency:
+                    time.sleep(fake.latency)
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _route(self, method: str):
+                parts = urlsplit(self.path)
+                with fake._lock:
+                    fake.requests[f"{method} {parts.path}"] += 1
+                user = fake.tokens.get(self.headers.get("Authorization"))
+                if user is None:
+                    self._reply(401, {"error": {"message": "Unauthorized"}})
+                    return None, None
+                with fake._lock:
+                    status = fake._failures.pop(0) if fake._failures else None
+                if status is not None:
+                    self._reply(status, {"error": {"message": "Injected failure"}})
+                    return None, None
+                return parts.path, parse_qs(parts.query)
+
+            def do_GET(self):
+                path, query = self._route("GET")
+                if path == "/users/me":
+                    self._reply(200, {"user": fake.tokens[self.headers["Authorization"]]})
+                elif path == "/incidents":
+                    self._reply(200, fake.list_incidents(query))
+                elif path == "/oncalls":
+                    self._reply(200, fake.list_oncalls(query))
+                elif path == "/services":
+                    self._reply(200, fake._page(fake.services, query, "services"))
+                elif path == "/teams":
+                    self._reply(200, fake._page(fake.teams, query, "teams"))
+                elif path is not None:
+                    self._reply(404, {"error": {"message": "Not Found"}})
+
+            def do_PUT(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                path, _ = self._route("PUT")
+                if path == "/incidents":
+                    self._reply(200, fake.update_incidents(body))
+                elif path is not None:
+                    self._reply(404, {"error": {"message": "Not Found"}})
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
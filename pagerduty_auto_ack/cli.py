@@ -1,27 +1,78 @@
 import argparse
+import asyncio
 import logging
 import os
+import signal
 import sys
+import threading
 import time
 import tomllib
 
-from . import pd
+from . import daemon, logs, metrics, pd, webhook
+from .governor import GovernedAdapter, Governors
+from .history import History
+from .rules import Matcher
+from .scheduler import RateLimit
+from .shards import SHARD_BY
+from .state import StateFile
+from .store import IncidentStore
+from .transport import Transport
 
 logging.basicConfig(
     level=os.environ.get("LOG_LEVEL", "INFO").upper(),
-    format="%(asctime)s  %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
+    format=logs.TEXT_FORMAT,
+    datefmt=logs.DATE_FORMAT,
 )
 
 logger = logging.getLogger(__name__)
 
 DEFAULTS = {
     "pagerduty_api_key": None,
+    "api_url": "https://api.pagerduty.com",
     "interval": 60,
     "urgencies": [],
     "action": "ack",
     "all_incidents": False,
     "schedule_id": None,
+    "mode": "poll",
+    "webhook_host": "127.0.0.1",
+    "webhook_port": 8080,
+    "webhook_secret": None,
+    "safety_interval": 300,
+    "use_async": False,
+    "update_concurrency": 4,
+    "min_interval": None,
+    "max_interval": None,
+    "max_incidents_per_cycle": None,
+    "full_listing_every": 1,
+    "recent_ttl": 120,
+    "state_file": None,
+    "database": None,
+    "log_format": "text",
+    "log_queue": False,
+    "log_incidents_per_cycle": 20,
+    "history_size": 1000,
+    "history_file": None,
+    "oncall_lookahead": 24,
+    "oncall_cache_ttl": 900,
+    "workers": 4,
+    "shards": 1,
+    "shard_by": "service",
+    "shard_refresh": 300,
+    "requests_per_minute": 960,
+    "pool_size": None,
+    "connect_timeout": 5.0,
+    "read_timeout": 30.0,
+    "retry_attempts": 4,
+    "retry_backoff": 0.5,
+    "breaker_threshold": 5,
+    "breaker_cooldown": 5.0,
+    "breaker_max_cooldown": 300.0,
+    "metrics_host": "127.0.0.1",
+    "metrics_port": None,
+    "rules": [],
+    "actions": {},
+    "users": [],
 }
 
 
@@ -62,8 +113,9 @@ def parse_args():
         "--action",
         required=False,
         choices=["ack", "resolve"],
+        action="append",
         default=None,
-        help="action to take on incidents (default: ack)",
+        help="action to take on incidents; repeat to run both from one listing (default: ack)",
     )
     parser.add_argument(
         "--all-incidents",
@@ -78,6 +130,130 @@ def parse_args():
         default=None,
         help="PagerDuty schedule ID; only process incidents when you are on-call",
     )
+    parser.add_argument(
+        "--mode",
+        required=False,
+        choices=["poll", "webhook"],
+        default=None,
+        help="poll the API every interval, or act on PagerDuty v3 webhooks (default: poll)",
+    )
+    parser.add_argument("--webhook-host", required=False, default=None)
+    parser.add_argument("--webhook-port", required=False, type=int, default=None)
+    parser.add_argument(
+        "--webhook-secret",
+        required=False,
+        default=None,
+        help="signing secret of the PagerDuty webhook subscription",
+    )
+    parser.add_argument(
+        "--safety-interval",
+        required=False,
+        type=int,
+        default=None,
+        help="in webhook mode, how often (in seconds) to poll for missed incidents",
+    )
+    parser.add_argument(
+        "--async",
+        required=False,
+        action="store_true",
+        default=None,
+        dest="use_async",
+        help="use the asyncio client and run independent API calls concurrently",
+    )
+    parser.add_argument(
+        "--update-concurrency",
+        required=False,
+        type=int,
+        default=None,
+        help="how many 250-incident update batches to send at once (default: 4)",
+    )
+    parser.add_argument(
+        "--max-incidents-per-cycle",
+        required=False,
+        type=int,
+        default=None,
+        help="stop listing once this many incidents were fetched; the rest wait for the next cycle",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        required=False,
+        type=int,
+        default=None,
+        help="serve Prometheus metrics on this port at /metrics (default: disabled)",
+    )
+    parser.add_argument(
+        "--min-interval",
+        required=False,
+        type=int,
+        default=None,
+        help="shortest sleep (in seconds) right after incidents were handled (default: interval)",
+    )
+    parser.add_argument(
+        "--max-interval",
+        required=False,
+        type=int,
+        default=None,
+        help="longest sleep (in seconds) after quiet cycles or when rate-limited (default: interval)",
+    )
+    parser.add_argument(
+        "--shards",
+        required=False,
+        type=int,
+        default=None,
+        help="split the incidents into this many partitions, each polled by its own worker (default: 1)",
+    )
+    parser.add_argument(
+        "--shard-by",
+        required=False,
+        choices=["service", "team"],
+        default=None,
+        help="partition incidents by service or by team (default: service)",
+    )
+    parser.add_argument(
+        "--state-file",
+        required=False,
+        default=None,
+        help="keep warm-restart state in this file (default: disabled)",
+    )
+    parser.add_argument(
+        "--log-format",
+        required=False,
+        choices=["text", "json"],
+        default=None,
+        help="log as plain text or as one JSON object per line (default: text)",
+    )
+    parser.add_argument(
+        "--log-queue",
+        required=False,
+        action="store_true",
+        default=None,
+        help="write logs from a background thread, off the polling path",
+    )
+    parser.add_argument(
+        "--database",
+        required=False,
+        default=None,
+        help="record every handled incident in this SQLite database (default: disabled)",
+    )
+
+    commands = parser.add_subparsers(dest="command", metavar="{report}")
+    report = commands.add_parser(
+        "report",
+        help="summarize the incidents recorded in --database",
+        description="Summarize the incidents recorded in --database: counts per service per day"
+        " and the time from creation to ack/resolve.",
+    )
+    # Also accepted before ``report``
+    report.add_argument("--config", default=argparse.SUPPRESS, help="path to TOML config file")
+    report.add_argument("--database", default=argparse.SUPPRESS, help="SQLite database written by the daemon")
+    report.add_argument("--days", type=int, default=7, help="how many days back to report (default: 7)")
+    report.add_argument(
+        "--action",
+        choices=["ack", "resolve"],
+        default=None,
+        dest="report_action",
+        help="only report this action (default: both)",
+    )
 
     return parser.parse_args()
 
@@ -100,94 +276,559 @@ def resolve_config(args):
         "action": pick(args.action, "action"),
         "all_incidents": pick(args.all_incidents, "all_incidents"),
         "schedule_id": pick(args.schedule_id, "schedule_id"),
+        "mode": pick(args.mode, "mode"),
+        "webhook_host": pick(args.webhook_host, "webhook_host"),
+        "webhook_port": pick(args.webhook_port, "webhook_port"),
+        "webhook_secret": pick(args.webhook_secret, "webhook_secret"),
+        "safety_interval": pick(args.safety_interval, "safety_interval"),
+        "use_async": pick(args.use_async, "use_async"),
+        "update_concurrency": pick(args.update_concurrency, "update_concurrency"),
+        "min_interval": pick(args.min_interval, "min_interval"),
+        "max_interval": pick(args.max_interval, "max_interval"),
+        "max_incidents_per_cycle": pick(args.max_incidents_per_cycle, "max_incidents_per_cycle"),
+        "metrics_port": pick(args.metrics_port, "metrics_port"),
+        "shards": pick(args.shards, "shards"),
+        "shard_by": pick(args.shard_by, "shard_by"),
+        "state_file": pick(args.state_file, "state_file"),
+        "database": pick(args.database, "database"),
+        "log_format": pick(args.log_format, "log_format"),
+        "log_queue": pick(args.log_queue, "log_queue"),
+        # Config file only
+        "api_url": config.get("api_url", DEFAULTS["api_url"]),
+        "metrics_host": config.get("metrics_host", DEFAULTS["metrics_host"]),
+        "history_size": config.get("history_size", DEFAULTS["history_size"]),
+        "history_file": config.get("history_file", DEFAULTS["history_file"]),
+        "oncall_lookahead": config.get("oncall_lookahead", DEFAULTS["oncall_lookahead"]),
+        "oncall_cache_ttl": config.get("oncall_cache_ttl", DEFAULTS["oncall_cache_ttl"]),
+        "log_incidents_per_cycle": config.get("log_incidents_per_cycle", DEFAULTS["log_incidents_per_cycle"]),
+        "full_listing_every": config.get("full_listing_every", DEFAULTS["full_listing_every"]),
+        "recent_ttl": config.get("recent_ttl", DEFAULTS["recent_ttl"]),
+        "workers": config.get("workers", DEFAULTS["workers"]),
+        "shard_refresh": config.get("shard_refresh", DEFAULTS["shard_refresh"]),
+        "requests_per_minute": config.get("requests_per_minute", DEFAULTS["requests_per_minute"]),
+        "pool_size": config.get("pool_size", DEFAULTS["pool_size"]),
+        "connect_timeout": config.get("connect_timeout", DEFAULTS["connect_timeout"]),
+        "read_timeout": config.get("read_timeout", DEFAULTS["read_timeout"]),
+        "retry_attempts": config.get("retry_attempts", DEFAULTS["retry_attempts"]),
+        "retry_backoff": config.get("retry_backoff", DEFAULTS["retry_backoff"]),
+        "breaker_threshold": config.get("breaker_threshold", DEFAULTS["breaker_threshold"]),
+        "breaker_cooldown": config.get("breaker_cooldown", DEFAULTS["breaker_cooldown"]),
+        "breaker_max_cooldown": config.get("breaker_max_cooldown", DEFAULTS["breaker_max_cooldown"]),
+        "rules": config.get("rules", DEFAULTS["rules"]),
+        "actions": config.get("actions", DEFAULTS["actions"]),
+        "users": config.get("users", DEFAULTS["users"]),
     }
 
 
+def cli_overrides(args) -> dict:
+    """Settings given explicitly on the command line."""
+    return {key: value for key, value in vars(args).items() if key in DEFAULTS and value is not None}
+
+
+def user_configs(cfg: dict, overrides: dict | None = None) -> list:
+    """One settings dict per ``[[users]]`` entry, each entry overriding the shared settings.
+
+    ``overrides`` (see :func:`cli_overrides`) are applied on top of every entry, so the
+    command line still wins over the config file. The API key is the exception: it is
+    what tells the entries apart.
+    """
+    shared = {k: v for k, v in cfg.items() if k != "users"}
+    if not cfg["users"]:
+        return [shared]
+    if not isinstance(cfg["users"], list) or not all(isinstance(entry, dict) for entry in cfg["users"]):
+        raise ValueError("users must be a list of [[users]] tables")
+    overrides = {k: v for k, v in (overrides or {}).items() if k != "pagerduty_api_key"}
+    return [{**shared, **entry, **overrides} for entry in cfg["users"]]
+
+
+# Settings only read at startup; changing them on reload needs a restart
+RESTART_ONLY = (
+    "pagerduty_api_key",
+    "api_url",
+    "mode",
+    "webhook_host",
+    "webhook_port",
+    "webhook_secret",
+    "use_async",
+    "workers",
+    "shards",
+    "shard_by",
+    "shard_refresh",
+    "requests_per_minute",
+    "pool_size",
+    "connect_timeout",
+    "read_timeout",
+    "metrics_host",
+    "metrics_port",
+    "history_size",
+    "history_file",
+    "state_file",
+    "database",
+    "log_format",
+    "log_queue",
+)
+# Longest wait between config file checks (and before a SIGHUP is acted on)
+RELOAD_CHECK_INTERVAL = 5
+
+
+class ConfigReloader:
+    """Re-reads the config file when it was modified or on SIGHUP.
+
+    :meth:`check` is called between cycles and returns the new per-user settings once,
+    when they changed and are valid; broken edits are logged and the running settings kept.
+    """
+
+    def __init__(self, args, cfg: dict):
+        self.args = args
+        self.cfg = cfg
+        self.user_cfgs = user_configs(cfg, cli_overrides(args))
+        self._mtime = self._stat()
+        self._requested = threading.Event()
+
+    def _stat(self) -> float | None:
+        try:
+            return os.stat(self.args.config).st_mtime_ns
+        except OSError:
+            return None
+
+    def request(self, *_):
+        """SIGHUP handler."""
+        self._requested.set()
+
+    def check(self) -> list | None:
+        mtime = self._stat()
+        if mtime == self._mtime and not self._requested.is_set():
+            return None
+        self._mtime = mtime
+        self._requested.clear()
+
+        try:
+            cfg = resolve_config(self.args)
+            user_cfgs = user_configs(cfg, cli_overrides(self.args))
+            error = validate(cfg, user_cfgs)
+        except (OSError, TypeError, ValueError) as e:
+            error = str(e)
+        if error:
+            logger.error(f"Not reloading {self.args.config}: {error}")
+            return None
+
+        old_keys = [user_cfg["pagerduty_api_key"] for user_cfg in self.user_cfgs]
+        if [user_cfg["pagerduty_api_key"] for user_cfg in user_cfgs] != old_keys:
+            logger.error(f"Not reloading {self.args.config}: adding or removing users needs a restart")
+            return None
+
+        changed = [key for key in RESTART_ONLY if cfg[key] != self.cfg[key]]
+        if changed:
+            logger.warning(f"Changes to {', '.join(changed)} only take effect after a restart")
+        for user_cfg, old in zip(user_cfgs, self.user_cfgs):
+            user_cfg.update((key, old[key]) for key in RESTART_ONLY)
+        cfg.update((key, self.cfg[key]) for key in RESTART_ONLY)
+
+        if user_cfgs == self.user_cfgs:
+            return None
+        self.cfg, self.user_cfgs = cfg, user_cfgs
+        logger.info(f"Reloaded {self.args.config}")
+        return user_cfgs
+
+
+def make_histories(user_cfgs: list) -> list:
+    """One ``{action: History}`` dict per user."""
+    histories = []
+    seen = set()
+    for n, user_cfg in enumerate(user_cfgs):
+        actions = daemon.actions_of(user_cfg)
+        user_histories = {}
+        for action in actions:
+            path = user_cfg["history_file"]
+            if path and len(actions) > 1:
+                path = f"{path}.{action}"
+            # Every history needs its own spill log
+            if path and path in seen:
+                path = f"{path}.{n}"
+            seen.add(path)
+            user_histories[action] = History(user_cfg["history_size"], path)
+        histories.append(user_histories)
+    return histories
+
+
+def poller_configs(user_cfgs: list) -> list:
+    """Settings per poller: every shard of a user runs with that user's settings."""
+    return [user_cfg for user_cfg in user_cfgs for _ in range(max(user_cfg["shards"], 1))]
+
+
+def make_clients(cfg: dict, user_cfgs: list) -> list:
+    # All users share one connection pool and one rate-limit governor per key
+    governors = Governors(rate=cfg["requests_per_minute"] / 60)
+    adapter = GovernedAdapter(governors, Transport.from_config(cfg))
+    return [
+        pd.get_client(user_cfg["pagerduty_api_key"], adapter=adapter, url=user_cfg["api_url"]) for user_cfg in user_cfgs
+    ]
+
+
+def cached_user(state: StateFile | None, api_key: str) -> dict | None:
+    user = state.user(api_key) if state is not None else None
+    if user:
+        logger.debug(f"Using saved identity {user.get('email')}")
+    return user
+
+
+def shard_tag(tag: str, shards, shard: int) -> str:
+    return f"{tag}[shard {shard + 1}/{shards.count}] " if shards is not None else tag
+
+
+def start_pollers(
+    user_cfgs: list,
+    clients: list,
+    histories: list,
+    state: StateFile | None = None,
+    store: IncidentStore | None = None,
+) -> list:
+    users = {}
+    pollers = []
+    for user_cfg, client, history in zip(user_cfgs, clients, histories):
+        key = user_cfg["pagerduty_api_key"]
+        if key not in users:
+            users[key] = cached_user(state, key) or pd.get_current_user(client)
+            if state is not None:
+                state.set_user(key, users[key])
+        tag = f"[{users[key].get('email')}] " if len(user_cfgs) > 1 else ""
+        shards = daemon.make_shards(user_cfg)
+        if shards is not None:
+            shards.load(pd.list_ids(client, shards.resource))
+        for shard in range(shards.count if shards else 1):
+            poller = daemon.Poller(
+                user_cfg, client, history, shard_tag(tag, shards, shard), state, shards, shard, store
+            )
+            poller.start(users[key])
+            pollers.append(poller)
+    return pollers
+
+
+def run(
+    cfg: dict,
+    user_cfgs: list,
+    histories: list,
+    state: StateFile | None = None,
+    reloader: ConfigReloader | None = None,
+    store: IncidentStore | None = None,
+):
+    clients = make_clients(cfg, user_cfgs)
+    try:
+        pollers = start_pollers(user_cfgs, clients, histories, state, store)
+
+        if cfg["mode"] == "webhook":
+
+            def on_incident(incident):
+                for poller in pollers:
+                    poller.on_incident(incident)
+
+            server = webhook.make_server(cfg["webhook_host"], cfg["webhook_port"], cfg["webhook_secret"], on_incident)
+            webhook.serve_in_background(server)
+            logger.info(
+                f"Listening for webhooks on {cfg['webhook_host']}:{cfg['webhook_port']},"
+                f" polling every {cfg['safety_interval']} seconds as a fallback"
+            )
+
+        def reload():
+            user_cfgs = reloader.check()
+            return poller_configs(user_cfgs) if user_cfgs is not None else None
+
+        daemon.run_pollers(pollers, cfg["workers"], reload if reloader else None, RELOAD_CHECK_INTERVAL)
+    finally:
+        for client in clients:
+            client.close()
+
+
+def make_async_clients(cfg: dict, user_cfgs: list) -> tuple:
+    """Returns the shared connector, one client per user and the RateLimit each client updates."""
+    from . import pd_async
+
+    settings = Transport.from_config(cfg)
+    connector = pd_async.make_connector(settings.pool_size, settings.keepalive)
+    governors = Governors(rate=cfg["requests_per_minute"] / 60)
+    ratelimits = [RateLimit() for _ in user_cfgs]
+    clients = [
+        pd_async.get_client(
+            user_cfg["pagerduty_api_key"],
+            base_url=user_cfg["api_url"],
+            connector=connector,
+            ratelimit=ratelimit,
+            governors=governors,
+            settings=settings,
+        )
+        for user_cfg, ratelimit in zip(user_cfgs, ratelimits)
+    ]
+    return connector, clients, ratelimits
+
+
+async def start_async_pollers(
+    user_cfgs: list,
+    clients: list,
+    ratelimits: list,
+    histories: list,
+    state: StateFile | None = None,
+    store: IncidentStore | None = None,
+) -> list:
+    from . import pd_async
+
+    keys = {user_cfg["pagerduty_api_key"]: client for user_cfg, client in zip(user_cfgs, clients)}
+    cached = {key: cached_user(state, key) for key in keys}
+    users = {key: user for key, user in cached.items() if user}
+    missing = {key: client for key, client in keys.items() if key not in users}
+    found = await asyncio.gather(*(pd_async.get_current_user(client) for client in missing.values()))
+    for key, user in zip(missing, found):
+        users[key] = user
+        if state is not None:
+            state.set_user(key, user)
+
+    shards = [daemon.make_shards(user_cfg) for user_cfg in user_cfgs]
+    sharded = [(s, client) for s, client in zip(shards, clients) if s is not None]
+    listed = await asyncio.gather(*(pd_async.list_ids(client, s.resource) for s, client in sharded))
+    for (s, _), ids in zip(sharded, listed):
+        s.load(ids)
+
+    pollers = []
+    for user_cfg, client, history, ratelimit, user_shards in zip(user_cfgs, clients, histories, ratelimits, shards):
+        user = users[user_cfg["pagerduty_api_key"]]
+        tag = f"[{user.get('email')}] " if len(user_cfgs) > 1 else ""
+        for shard in range(user_shards.count if user_shards else 1):
+            poller = daemon.AsyncPoller(
+                user_cfg,
+                client,
+                history,
+                ratelimit,
+                shard_tag(tag, user_shards, shard),
+                state,
+                user_shards,
+                shard,
+                store,
+            )
+            poller.start(user)
+            pollers.append(poller)
+    return pollers
+
+
+async def watch_config(reloader: ConfigReloader, pollers: list):
+    while True:
+        await asyncio.sleep(RELOAD_CHECK_INTERVAL)
+        user_cfgs = reloader.check()
+        if user_cfgs is not None:
+            for poller, user_cfg in zip(pollers, poller_configs(user_cfgs)):
+                poller.reconfigure(user_cfg)
+
+
+async def run_async(
+    cfg: dict,
+    user_cfgs: list,
+    histories: list,
+    state: StateFile | None = None,
+    reloader: ConfigReloader | None = None,
+    store: IncidentStore | None = None,
+):
+    connector, clients, ratelimits = make_async_clients(cfg, user_cfgs)
+    try:
+        pollers = await start_async_pollers(user_cfgs, clients, ratelimits, histories, state, store)
+        tasks = [poller.run() for poller in pollers]
+        if reloader is not None:
+            tasks.append(watch_config(reloader, pollers))
+        await asyncio.gather(*tasks)
+    finally:
+        for client in clients:
+            await client.close()
+        await connector.close()
+
+
+def print_summary(action_label: str, history: History, who: str = ""):
+    count = len(history)
+    logger.info(f"Shutting down. Total {action_label}{who}: {count}")
+    if count:
+        print(f"\n{'─' * 50}")
+        print(f"  {action_label.upper()} INCIDENTS SUMMARY{who}")
+        print(f"{'─' * 50}")
+        for inc in history:
+            print(f"  #{inc.number}  {inc.title}")
+        print(f"{'─' * 50}")
+        print(f"  Total: {count}")
+        print(f"{'─' * 50}")
+
+
+def report(cfg: dict, days: int, action: str | None = None):
+    if not cfg["database"] or not os.path.exists(cfg["database"]):
+        logger.error(f"No database to report on: {cfg['database'] or 'set --database (via CLI or config file)'}")
+        sys.exit(1)
+    store = IncidentStore(cfg["database"])
+    since = time.time() - days * 86400
+    try:
+        rows = store.daily_counts(since, action)
+        print(f"\n  HANDLED INCIDENTS PER SERVICE PER DAY (UTC), LAST {days} DAYS")
+        print(f"{'─' * 50}")
+        for day, service_id, row_action, count in rows:
+            print(f"  {day}  {service_id or '-':<14} {row_action:<8} {count:>8}")
+        print(f"{'─' * 50}")
+        print(f"  Total: {sum(row[3] for row in rows)}")
+
+        for name in [action] if action else list(daemon.ACTIONS):
+            count, values, longest = store.latency_percentiles(since, name)
+            print(f"\n  TIME TO {daemon.ACTIONS[name][1].upper()[:-1]}, LAST {days} DAYS")
+            print(f"{'─' * 50}")
+            if not count:
+                print("  No incidents")
+                continue
+            for p, value in values.items():
+                print(f"  p{p:<4} {value:>12,} ms")
+            print(f"  max   {longest:>12,} ms")
+            print(f"  ({count} incidents)")
+    finally:
+        store.close()
+
+
+# Settings that must be numbers; those defaulting to None may also be left unset
+NUMERIC = (
+    "interval",
+    "webhook_port",
+    "safety_interval",
+    "update_concurrency",
+    "min_interval",
+    "max_interval",
+    "max_incidents_per_cycle",
+    "full_listing_every",
+    "recent_ttl",
+    "log_incidents_per_cycle",
+    "history_size",
+    "oncall_lookahead",
+    "oncall_cache_ttl",
+    "workers",
+    "shards",
+    "shard_refresh",
+    "requests_per_minute",
+    "pool_size",
+    "connect_timeout",
+    "read_timeout",
+    "retry_attempts",
+    "retry_backoff",
+    "breaker_threshold",
+    "breaker_cooldown",
+    "breaker_max_cooldown",
+    "metrics_port",
+)
+
+
+def validate(cfg: dict, user_cfgs: list) -> str | None:
+    """The first problem with the settings, if any. Badly typed settings are reported, not raised."""
+    for user_cfg in user_cfgs:
+        for key in NUMERIC:
+            value = user_cfg[key]
+            if value is None and DEFAULTS[key] is None:
+                continue
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                return f"{key} must be a number, got {value!r}"
+    try:
+        return check_settings(cfg, user_cfgs)
+    except (AttributeError, TypeError, ValueError) as e:
+        return f"Bad settings: {e}"
+
+
+def is_strings(value) -> bool:
+    return isinstance(value, list) and all(isinstance(v, str) for v in value)
+
+
+def check_settings(cfg: dict, user_cfgs: list) -> str | None:
+    if not all(user_cfg["pagerduty_api_key"] for user_cfg in user_cfgs):
+        return "--pagerduty-api-key is required (via CLI or config file, for every [[users]] entry)"
+
+    if cfg["mode"] not in ("poll", "webhook"):
+        return f"Bad mode setting: {cfg['mode']!r} (choose from poll, webhook)"
+    if cfg["log_format"] not in ("text", "json"):
+        return f"Bad log_format setting: {cfg['log_format']!r} (choose from text, json)"
+    if cfg["mode"] == "webhook":
+        if not cfg["webhook_secret"]:
+            return "--webhook-secret is required in webhook mode (via CLI or config file)"
+        if cfg["use_async"]:
+            return "--async is not supported in webhook mode"
+
+    for user_cfg in user_cfgs:
+        actions = daemon.actions_of(user_cfg)
+        if not actions or set(actions) - set(daemon.ACTIONS):
+            return f"Bad action setting: {user_cfg['action']!r} (choose from {', '.join(daemon.ACTIONS)})"
+        if not isinstance(user_cfg["actions"], dict):
+            return f"actions must be a table of per-action settings, got {user_cfg['actions']!r}"
+        for action in actions:
+            try:
+                Matcher(daemon.action_setting(user_cfg, action, "rules"))
+            except ValueError as e:
+                return f"Bad rules for {action}: {e}"
+            urgencies = daemon.action_setting(user_cfg, action, "urgencies")
+            if not is_strings(urgencies):
+                return f"urgencies for {action} must be a list of strings, got {urgencies!r}"
+        schedule_id = user_cfg["schedule_id"]
+        if not (schedule_id is None or isinstance(schedule_id, str) or is_strings(schedule_id)):
+            return f"schedule_id must be a string or a list of strings, got {schedule_id!r}"
+        try:
+            daemon.make_scheduler(user_cfg)
+        except ValueError as e:
+            return f"Bad interval settings: {e}"
+        if user_cfg["retry_attempts"] < 1 or user_cfg["breaker_threshold"] < 1:
+            return "retry_attempts and breaker_threshold must be at least 1"
+        if user_cfg["shards"] < 1 or not isinstance(user_cfg["shard_by"], str) or user_cfg["shard_by"] not in SHARD_BY:
+            return f"Bad shard settings: {user_cfg['shards']} shards by {user_cfg['shard_by']!r}"
+    return None
+
+
 def main():
     args = parse_args()
     cfg = resolve_config(args)
+    if args.command == "report":
+        report(cfg, args.days, args.report_action)
+        return
+    try:
+        user_cfgs = user_configs(cfg, cli_overrides(args))
+    except (TypeError, ValueError) as e:
+        logger.error(e)
+        sys.exit(1)
 
-    pd_api_key = cfg["pagerduty_api_key"]
-    if not pd_api_key:
-        logger.error("--pagerduty-api-key is required (via CLI or config file)")
+    if cfg["log_format"] == "json" or cfg["log_queue"]:
+        logs.configure(cfg["log_format"], cfg["log_queue"])
+
+    error = validate(cfg, user_cfgs)
+    if error:
+        logger.error(error)
         sys.exit(1)
 
-    action = cfg["action"]
-    interval = cfg["interval"]
-    urgencies = cfg["urgencies"]
-    all_incidents = cfg["all_incidents"]
-    schedule_id = cfg["schedule_id"]
+    if cfg["metrics_port"]:
+        server = metrics.make_server(cfg["metrics_host"], cfg["metrics_port"])
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+        logger.info(f"Serving metrics on http://{cfg['metrics_host']}:{cfg['metrics_port']}/metrics")
 
-    try:
-        ack_incidents = []
-        with pd.get_client(pd_api_key) as pd_client:
-            user = pd.get_current_user(pd_client)
-            user_email = user.get("email")
-            user_id = user.get("id")
-
-            if action == "resolve":
-                statuses = ["triggered", "acknowledged"]
-                action_fn = pd.resolve_incidents
-                action_label = "resolved"
-            else:
-                statuses = ["triggered"]
-                action_fn = pd.acknowledge_incidents
-                action_label = "acknowledged"
-
-            scope = "all incidents" if all_incidents else "my incidents"
-            schedule_info = f", schedule: {schedule_id}" if schedule_id else ""
-            logger.info(f"Running as user: {user_email} (action: {action}, scope: {scope}{schedule_info})")
-
-            user_ids = [] if all_incidents else [user_id]
-
-            while True:
-                try:
-                    # 如果配置了 schedule_id，先检查是否在值班
-                    if schedule_id:
-                        if not pd.is_user_oncall(pd_client, user_id, schedule_id):
-                            logger.info("Not on-call, skipping")
-                            time.sleep(interval)
-                            continue
-
-                    incidents = list(pd.get_incidents(
-                        pd_client,
-                        user_ids=user_ids,
-                        urgencies=urgencies,
-                        statuses=statuses,
-                    ))
-
-                    # PD API supports max of 250 updates at the same time
-                    incidents = incidents[:250]
-                    incident_ids = [i.get("id") for i in incidents]
-
-                    ack_incidents += incidents
-
-                    action_fn(pd_client, incident_ids)
-
-                    if incidents:
-                        logger.info(f"{len(incidents)} incidents {action_label}:")
-                        for inc in incidents:
-                            logger.info(f"  -> #{inc.get('incident_number')}  {inc.get('title', 'N/A')}")
-                    else:
-                        logger.info(f"No incidents to {action_label[:-1]}")
-                except Exception:
-                    logger.warning("Request failed, will retry next cycle", exc_info=True)
-
-                logger.debug(f"Sleeping for {interval} seconds")
-                time.sleep(interval)
+    state = None
+    if cfg["state_file"]:
+        state = StateFile(cfg["state_file"])
+        state.load()
+
+    reloader = None
+    if args.config:
+        reloader = ConfigReloader(args, cfg)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, reloader.request)
+
+    store = IncidentStore(cfg["database"]) if cfg["database"] else None
 
+    histories = make_histories(user_cfgs)
+    try:
+        if cfg["use_async"]:
+            asyncio.run(run_async(cfg, user_cfgs, histories, state, reloader, store))
+        else:
+            run(cfg, user_cfgs, histories, state, reloader, store)
     except KeyboardInterrupt:
-        count = len(ack_incidents)
-        logger.info(f"Shutting down. Total {action_label}: {count}")
-        if ack_incidents:
-            print(f"\n{'─' * 50}")
-            print(f"  {action_label.upper()} INCIDENTS SUMMARY")
-            print(f"{'─' * 50}")
-            for inc in ack_incidents:
-                print(f"  #{inc.get('incident_number')}  {inc.get('title', 'N/A')}")
-            print(f"{'─' * 50}")
-            print(f"  Total: {count}")
-            print(f"{'─' * 50}")
+        for n, (user_cfg, user_histories) in enumerate(zip(user_cfgs, histories)):
+            who = f" (user #{n + 1})" if len(user_cfgs) > 1 else ""
+            for action, history in user_histories.items():
+                print_summary(daemon.ACTIONS[action][1], history, who)
+    finally:
+        for user_histories in histories:
+            for history in user_histories.values():
+                history.close()
+        if store is not None:
+            store.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,684 @@
+"""Poll loops for one or many PagerDuty users sharing one process."""
+
+import asyncio
+import heapq
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from . import metrics, pd
+from .history import History, RecentIds
+from .oncall import OncallWindows, parse_timestamp
+from .retry import CircuitOpenError, RetryPolicy
+from .rules import PUSHDOWN_PARAMS, Matcher
+from .scheduler import AdaptiveScheduler, RateLimit
+from .shards import CATCH_ALL_LIMIT, MAX_IDS, Shards
+from .state import StateFile
+from .store import IncidentStore
+from .watermark import Watermark
+
+logger = logging.getLogger(__name__)
+
+# action -> (statuses it applies to, status it sets, which also reads as past tense in logs)
+ACTIONS = {
+    "ack": (["triggered"], "acknowledged"),
+    "resolve": (["triggered", "acknowledged"], "resolved"),
+}
+
+
+class Route:
+    """One of a poller's actions and the filters that send an incident to it."""
+
+    def __init__(self, action: str, urgencies: list, matcher: Matcher, history: History):
+        self.action = action
+        self.statuses, self.status = ACTIONS[action]
+        self.urgencies = urgencies
+        self.matcher = matcher
+        self.history = history
+
+    def matches(self, incident: dict) -> bool:
+        if incident.get("status") not in self.statuses:
+            return False
+        if self.urgencies and incident.get("urgency") not in self.urgencies:
+            return False
+        return self.matcher.matches(incident)
+
+
+def matches_filters(incident: dict, user_id: str, urgencies: list, all_incidents: bool) -> bool:
+    """Apply the same filters to a pushed incident that get_incidents applies server-side."""
+    if urgencies and incident.get("urgency") not in urgencies:
+        return False
+    if all_incidents:
+        return True
+    return any(a.get("assignee", {}).get("id") == user_id for a in incident.get("assignments", []))
+
+
+def actions_of(cfg: dict) -> list:
+    """``action`` may be a single action or, to run several from one listing, a list of them."""
+    action = cfg["action"]
+    return [action] if isinstance(action, str) else list(action)
+
+
+def action_setting(cfg: dict, action: str, key: str):
+    """Per-action settings come from the ``[actions.<action>]`` tables, defaulting to the shared ones."""
+    return cfg["actions"].get(action, {}).get(key, cfg[key])
+
+
+def make_routes(cfg: dict, histories: dict) -> list:
+    return [
+        Route(
+            action,
+            action_setting(cfg, action, "urgencies"),
+            Matcher(action_setting(cfg, action, "rules")),
+            histories[action],
+        )
+        for action in actions_of(cfg)
+    ]
+
+
+def listing_params(routes: list) -> dict:
+    """Server-side filters for one listing that covers every route.
+
+    A filter is only pushed down to the API when every route restricts that field;
+    the routes still check every listed incident themselves.
+    """
+    statuses = [status for status in ("triggered", "acknowledged") if any(status in r.statuses for r in routes)]
+    restricted = []
+    for route in routes:
+        fields = dict(route.matcher.pushdown())
+        if route.urgencies:
+            fields["urgencies"] = frozenset(route.urgencies)
+        restricted.append(fields)
+
+    params = {"statuses": statuses}
+    for field, param in PUSHDOWN_PARAMS.items():
+        if all(field in fields for fields in restricted):
+            params[param] = sorted(frozenset().union(*(fields[field] for fields in restricted)))
+        else:
+            params[param] = []
+    return params
+
+
+def route_incidents(routes: list, incidents: list) -> list:
+    """(route, incidents) pairs; each incident goes to the first route that matches it."""
+    routed: list[tuple[Route, list]] = [(route, []) for route in routes]
+    for incident in incidents:
+        for route, matched in routed:
+            if route.matches(incident):
+                matched.append(incident)
+                break
+    return routed
+
+
+def schedule_ids_of(cfg: dict) -> list:
+    """``schedule_id`` may be a single ID or, in the config file, a list of IDs."""
+    schedule_id = cfg["schedule_id"]
+    if not schedule_id:
+        return []
+    return [schedule_id] if isinstance(schedule_id, str) else list(schedule_id)
+
+
+def make_scheduler(cfg: dict) -> AdaptiveScheduler:
+    if cfg["mode"] == "webhook":
+        # Webhooks do the real work, polling only catches deliveries that never arrived
+        interval = cfg["safety_interval"]
+        return AdaptiveScheduler(interval, interval)
+
+    interval = cfg["interval"]
+    return AdaptiveScheduler(cfg["min_interval"] or interval, cfg["max_interval"] or interval)
+
+
+def make_oncall_windows(cfg: dict) -> OncallWindows:
+    return OncallWindows(lookahead=cfg["oncall_lookahead"] * 3600, max_age=cfg["oncall_cache_ttl"])
+
+
+def make_watermark(cfg: dict) -> Watermark:
+    return Watermark(full_every=cfg["full_listing_every"])
+
+
+def next_sleep(scheduler: AdaptiveScheduler, handled: int, ratelimit, windows: OncallWindows, oncall: bool) -> float:
+    """Off-call there is nothing to poll for, so sleep until the shift starts (or the cache expires)."""
+    if not oncall:
+        return max(windows.seconds_until_change(), 1.0)
+    interval = scheduler.observe(handled, ratelimit)
+    if windows.needs_refresh():
+        return interval
+    return max(min(interval, windows.seconds_until_change()), 1.0)
+
+
+def log_failure(tag: str, exc: Exception, retry_in: float):
+    if isinstance(exc, CircuitOpenError):
+        logger.info(f"{tag}{exc}")
+    else:
+        logger.warning(f"{tag}Request failed, will retry in {retry_in:g}s", exc_info=exc)
+
+
+def skip_recent(recent: RecentIds, routed: list, tag: str = "") -> list:
+    """Drop routed incidents that already got the same action within the TTL."""
+    fresh = [(route, recent.fresh(incidents, route.action)) for route, incidents in routed]
+    skipped = sum(len(incidents) for _, incidents in routed) - sum(len(incidents) for _, incidents in fresh)
+    if skipped:
+        logger.debug(f"{tag}Skipping {skipped} incidents handled in the last {recent.ttl:g}s")
+    return fresh
+
+
+def make_shards(cfg: dict) -> Shards | None:
+    if cfg["shards"] <= 1:
+        return None
+    return Shards(cfg["shard_by"], cfg["shards"], cfg["shard_refresh"])
+
+
+def keeps_history(poller) -> bool:
+    """Shards of one user share its history; only the first one saves and restores it."""
+    return poller.shards is None or poller.shard == 0
+
+
+def shard_listings(poller) -> list:
+    """(filters, limit, catch-all) of each listing this cycle, none when the shard has nothing to list.
+
+    Unsharded that is the poller's own listing; a shard lists its IDs a chunk at a time, and
+    shard 0 adds the catch-all listing when the account's IDs are being partitioned.
+    """
+    limit = poller.cfg["max_incidents_per_cycle"]
+    if poller.shards is None:
+        return [(poller.listing, limit, False)]
+    param = poller.shards.param
+    ids = poller.shards.partition(poller.shard, poller.listing[param])
+    listings = [({**poller.listing, param: chunk}, limit, False) for chunk in pd.batched(ids, MAX_IDS)]
+    if poller.shard == 0 and not poller.listing[param]:
+        listings.append((poller.listing, min(limit or CATCH_ALL_LIMIT, CATCH_ALL_LIMIT), True))
+    return listings
+
+
+def merge_listings(poller, listings: list, results: list, since: str | None) -> tuple[list, list, bool]:
+    """The incidents this poller handles from a cycle's listings, each once.
+
+    Also returns the incidents the watermark may advance over and whether a full listing was
+    cut short by its limit. Oldest first, a listing cut short only got as far as its last
+    incident, so the mark stays there even where other listings went further. The catch-all
+    is one page and is not expected to cover a full listing.
+    """
+    listed, seen, cutoffs, truncated = [], set(), [], False
+    for (_, limit, catch_all), incidents in zip(listings, results):
+        for incident in incidents:
+            if incident["id"] not in seen:
+                seen.add(incident["id"])
+                listed.append(incident)
+        if incidents and limit and len(incidents) >= limit:
+            if since is not None:
+                cutoffs.append(parse_timestamp(incidents[-1].get("created_at"), 0.0))
+            elif not catch_all:
+                truncated = True
+    marked = listed
+    if cutoffs:
+        marked = [incident for incident in listed if parse_timestamp(incident.get("created_at"), 0.0) <= min(cutoffs)]
+    return owned(poller, listed), marked, truncated
+
+
+def owned(poller, incidents: list) -> list:
+    """Drop incidents listed by this shard that belong to another one."""
+    if poller.shards is None:
+        return incidents
+    return poller.shards.owned(poller.shard, incidents, poller.listing[poller.shards.param])
+
+
+def state_key(poller) -> str:
+    key = "+".join(actions_of(poller.cfg))
+    if poller.shards is not None:
+        key += f"#{poller.shard + 1}/{poller.shards.count}"
+    return key
+
+
+def dump_state(poller) -> dict:
+    state = {
+        "schedule_ids": poller.schedule_ids,
+        "watermark": poller.watermark.dump(),
+        "oncall": poller.windows.dump(),
+        "recent": poller.recent.dump(),
+    }
+    if keeps_history(poller):
+        state["history"] = {route.action: route.history.dump() for route in poller.routes}
+    return state
+
+
+def restore_state(poller, state: StateFile | None):
+    saved = state and state.poller(poller.cfg["pagerduty_api_key"], state_key(poller))
+    if not saved:
+        return
+    try:
+        poller.watermark.restore(saved["watermark"])
+        # Windows cached for other schedules would answer the wrong question
+        if saved["schedule_ids"] == poller.schedule_ids:
+            poller.windows.restore(saved["oncall"])
+        poller.recent.restore(saved["recent"])
+        if keeps_history(poller):
+            for route in poller.routes:
+                route.history.restore(saved["history"].get(route.action, []))
+    except (AttributeError, KeyError, TypeError, ValueError):
+        logger.warning(f"{poller.tag}Ignoring unusable saved state", exc_info=True)
+        return
+    if keeps_history(poller):
+        restored = sum(len(route.history) for route in poller.routes)
+        logger.info(f"{poller.tag}Restored state: {restored} handled incidents")
+
+
+def save_state(poller):
+    if poller.state is not None:
+        poller.state.set_poller(poller.cfg["pagerduty_api_key"], state_key(poller), dump_state(poller))
+        poller.state.save()
+
+
+def log_handled(routed: list, elapsed: float, tag: str = "", limit: int | None = None):
+    """One summary line per action, and no more than ``limit`` incident lines per cycle."""
+    if not any(incidents for _, incidents in routed):
+        logger.info(f"{tag}No incidents to {' or '.join(route.status[:-1] for route, _ in routed)}")
+        return
+    budget = limit
+    for route, incidents in routed:
+        if not incidents:
+            continue
+        shown = incidents if budget is None else incidents[: max(budget, 0)]
+        if budget is not None:
+            budget -= len(shown)
+        batches = len(pd.batched(incidents))
+        more = f", first {len(shown)} shown" if 0 < len(shown) < len(incidents) else ""
+        logger.info(
+            f"{tag}{len(incidents)} incidents {route.status} in {batches} batches ({elapsed:.2f}s){more}"
+            + (":" if shown else ""),
+            extra={"action": route.action, "handled": len(incidents), "batches": batches, "elapsed": elapsed},
+        )
+        for inc in shown:
+            logger.info(
+                f"{tag}  -> #{inc.get('incident_number')}  {inc.get('title', 'N/A')}",
+                extra={"action": route.action, "incident": inc.get("id")},
+            )
+
+
+def updates_of(routed: list) -> list:
+    """All routes' updates, so they go out in the same batches."""
+    return [(incident["id"], route.status) for route, incidents in routed for incident in incidents]
+
+
+def record_handled(poller, routed: list, marked: list, since: str | None, truncated: bool, elapsed: float) -> int:
+    """Bookkeeping once a cycle's updates went through; returns how many incidents were handled.
+
+    ``marked``, ``truncated``: as returned by :func:`merge_listings`.
+    """
+    metrics.CYCLE_PHASE_SECONDS.observe(elapsed, phase="update")
+    for route, incidents in routed:
+        poller.recent.add([incident["id"] for incident in incidents], route.action)
+    poller.watermark.advance(marked, since, truncated=truncated)
+    for route, incidents in routed:
+        route.history.extend(incidents)
+        metrics.observe_handled(incidents, route.action)
+    log_handled(routed, elapsed, poller.tag, poller.cfg["log_incidents_per_cycle"])
+    return sum(len(incidents) for _, incidents in routed)
+
+
+def store_handled(poller, routed: list):
+    """Write the cycle's incidents to the database, if any, in one transaction."""
+    if poller.store is not None:
+        poller.store.add([(route.action, incidents) for route, incidents in routed])
+
+
+def apply_config(poller, cfg: dict):
+    """Switch a poller to reloaded settings, keeping its client, history and whatever caches still apply."""
+    for action in actions_of(cfg):
+        if action not in poller.histories:
+            # Only actions added by a reload get here; their overflow goes to a temporary file
+            poller.histories[action] = History(cfg["history_size"])
+    routes = make_routes(cfg, poller.histories)
+    listing = listing_params(routes)
+    user_ids = [] if cfg["all_incidents"] else [poller.user_id]
+
+    if (
+        schedule_ids_of(cfg) != poller.schedule_ids
+        or cfg["oncall_lookahead"] != poller.cfg["oncall_lookahead"]
+        or cfg["oncall_cache_ttl"] != poller.cfg["oncall_cache_ttl"]
+    ):
+        poller.schedule_ids = schedule_ids_of(cfg)
+        poller.windows = make_oncall_windows(cfg)
+    if listing != poller.listing or user_ids != poller.user_ids:
+        # Incidents the old filters skipped may be older than the mark
+        poller.watermark = make_watermark(cfg)
+    else:
+        poller.watermark.full_every = cfg["full_listing_every"]
+    poller.recent.ttl = cfg["recent_ttl"]
+    poller.retry.configure(cfg)
+    poller.scheduler = make_scheduler(cfg)
+    poller.routes, poller.listing, poller.user_ids, poller.cfg = routes, listing, user_ids, cfg
+    logger.info(f"{poller.tag}Settings reloaded (action: {', '.join(actions_of(cfg))})")
+
+
+def log_start(poller, user: dict, suffix: str = ""):
+    if poller.shards is not None:
+        if poller.shard:
+            return
+        suffix = f", {poller.shards.count} shards by {poller.shards.by}{suffix}"
+    all_incidents = poller.cfg["all_incidents"]
+    scope = "all incidents" if all_incidents else "my incidents"
+    schedule_info = f", schedule: {', '.join(poller.schedule_ids)}" if poller.schedule_ids else ""
+    actions = ", ".join(actions_of(poller.cfg))
+    logger.info(f"Running as user: {user.get('email')} (action: {actions}, scope: {scope}{schedule_info}{suffix})")
+
+
+class Poller:
+    """Lists and acts on the incidents of one user (one API key and its settings).
+
+    ``cycle`` runs one check and returns how long to wait before the next one, so that
+    many pollers can be driven by :func:`run_pollers` from a single worker pool.
+    """
+
+    def __init__(
+        self,
+        cfg: dict,
+        client: pd.Session,
+        histories: dict,
+        tag: str = "",
+        state: StateFile | None = None,
+        shards: Shards | None = None,
+        shard: int = 0,
+        store: IncidentStore | None = None,
+    ):
+        self.cfg = cfg
+        self.client = client
+        self.histories = histories
+        self.routes = make_routes(cfg, histories)
+        self.listing = listing_params(self.routes)
+        self.tag = tag
+        self.schedule_ids = schedule_ids_of(cfg)
+        self.scheduler = make_scheduler(cfg)
+        self.windows = make_oncall_windows(cfg)
+        self.watermark = make_watermark(cfg)
+        self.recent = RecentIds(cfg["recent_ttl"])
+        self.retry = RetryPolicy.from_config(cfg, tag)
+        self.shards = shards
+        self.shard = shard
+        self.store = store
+        self.user_id = ""  # set by start()
+        self.state = state
+        self.pending_cfg: dict | None = None
+        restore_state(self, state)
+
+    def reconfigure(self, cfg: dict):
+        """Take new settings; they are applied before the next cycle starts."""
+        self.pending_cfg = cfg
+
+    def start(self, user: dict):
+        self.user_id = user["id"]
+        all_incidents = self.cfg["all_incidents"]
+        self.user_ids = [] if all_incidents else [self.user_id]
+        log_start(self, user)
+
+    def refresh_shards(self):
+        if self.shards is None or not self.shards.claim_refresh():
+            return
+        try:
+            self.shards.load(pd.list_ids(self.client, self.shards.resource))
+        except Exception:
+            self.shards.release()
+            logger.warning(f"{self.tag}Failed to list {self.shards.resource}, keeping the old shards", exc_info=True)
+
+    def is_oncall(self) -> bool:
+        if not self.schedule_ids:
+            return True
+        return pd.is_user_oncall_cached(self.client, self.windows, self.user_id, self.schedule_ids)
+
+    def on_incident(self, incident: dict):
+        """Handle an incident pushed by a webhook."""
+        routed = route_incidents(self.routes, [incident])
+        route = next((route for route, matched in routed if matched), None)
+        if (
+            route is None
+            or not matches_filters(incident, self.user_id, [], self.cfg["all_incidents"])
+            or not owned(self, [incident])
+        ):
+            logger.debug(f"{self.tag}Ignoring webhook for #{incident.get('incident_number')}")
+            return
+        if not self.recent.fresh([incident], route.action):
+            logger.debug(f"{self.tag}Ignoring repeated webhook for #{incident.get('incident_number')}")
+            return
+        if not self.is_oncall():
+            logger.info(f"{self.tag}Not on-call, skipping")
+            return
+
+        deadline = time.monotonic() + self.scheduler.interval
+        self.retry.call(
+            "PUT /incidents", lambda: pd.update_incidents(self.client, [(incident["id"], route.status)]), deadline
+        )
+        self.recent.add([incident["id"]], route.action)
+        store_handled(self, [(route, [incident])])
+        metrics.observe_handled([incident], route.action)
+        route.history.append(incident)
+        logger.info(
+            f"{self.tag}Incident {route.status} via webhook:"
+            f" #{incident.get('incident_number')}  {incident.get('title', 'N/A')}"
+        )
+
+    def cycle(self) -> float:
+        if self.pending_cfg is not None:
+            apply_config(self, self.pending_cfg)
+            self.pending_cfg = None
+        handled = 0
+        oncall = True
+        failed = None
+        # Retries have to be done by the time the next cycle would start anyway
+        deadline = time.monotonic() + self.scheduler.interval
+        try:
+            # 如果配置了 schedule_id，先检查是否在值班
+            started = time.monotonic()
+            oncall = self.is_oncall()
+            metrics.CYCLE_PHASE_SECONDS.observe(time.monotonic() - started, phase="oncall")
+            if oncall:
+                self.refresh_shards()
+            listings = shard_listings(self)
+            if not oncall:
+                logger.info(f"{self.tag}Not on-call, skipping")
+            elif not listings:
+                logger.debug(f"{self.tag}Nothing to list in this shard, skipping")
+            else:
+                started = time.monotonic()
+                since = self.watermark.since()
+                results = [
+                    self.retry.call(
+                        "GET /incidents",
+                        lambda: list(pd.get_incidents(
+                            self.client,
+                            user_ids=self.user_ids,
+                            limit=limit,
+                            since=since,
+                            sort_by=self.watermark.sort_by(since),
+                            **filters,
+                        )),
+                        deadline,
+                    )
+                    for filters, limit, _ in listings
+                ]
+                metrics.CYCLE_PHASE_SECONDS.observe(time.monotonic() - started, phase="list")
+                listed, marked, truncated = merge_listings(self, listings, results, since)
+                routed = skip_recent(self.recent, route_incidents(self.routes, listed), self.tag)
+
+                started = time.monotonic()
+                updates = updates_of(routed)
+                self.retry.call(
+                    "PUT /incidents",
+                    lambda: pd.update_incidents(self.client, updates, max_concurrency=self.cfg["update_concurrency"]),
+                    deadline,
+                )
+                handled = record_handled(self, routed, marked, since, truncated, time.monotonic() - started)
+                store_handled(self, routed)
+        except Exception as e:
+            failed = e
+
+        save_state(self)
+        interval = next_sleep(self.scheduler, handled, self.client.ratelimit, self.windows, oncall)
+        if failed is not None:
+            interval = self.retry.retry_in(interval, failed)
+            log_failure(self.tag, failed, interval)
+        logger.debug(f"{self.tag}Sleeping for {interval} seconds")
+        return interval
+
+
+def run_pollers(pollers: list, workers: int, reload=None, reload_every: float | None = None):
+    """Run every poller's cycles on a shared pool of ``workers`` threads, each on its own timetable.
+
+    ``reload`` is called whenever the loop wakes up, and at least every ``reload_every`` seconds;
+    when it returns new per-user settings, each poller switches to them before its next cycle.
+    """
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="poller")
+    due = [(0.0, i) for i in range(len(pollers))]
+    running = {}
+    try:
+        while True:
+            user_cfgs = reload() if reload is not None else None
+            if user_cfgs is not None:
+                for poller, user_cfg in zip(pollers, user_cfgs):
+                    poller.reconfigure(user_cfg)
+
+            now = time.monotonic()
+            while due and due[0][0] <= now:
+                _, i = heapq.heappop(due)
+                running[pool.submit(pollers[i].cycle)] = i
+
+            timeout = max(due[0][0] - now, 0) if due else None
+            if reload is not None and reload_every is not None:
+                timeout = reload_every if timeout is None else min(timeout, reload_every)
+            if timeout is not None and not running:
+                # Every poller is asleep, and wait() returns at once on an empty set
+                time.sleep(timeout)
+                continue
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = running.pop(future)
+                heapq.heappush(due, (time.monotonic() + future.result(), i))
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+class AsyncPoller:
+    """asyncio counterpart of :class:`Poller`; every user gets its own task in one event loop."""
+
+    def __init__(
+        self,
+        cfg: dict,
+        client,
+        histories: dict,
+        ratelimit: RateLimit,
+        tag: str = "",
+        state: StateFile | None = None,
+        shards: Shards | None = None,
+        shard: int = 0,
+        store: IncidentStore | None = None,
+    ):
+        from . import pd_async
+
+        self.pd = pd_async
+        self.cfg = cfg
+        self.client = client
+        self.histories = histories
+        self.routes = make_routes(cfg, histories)
+        self.listing = listing_params(self.routes)
+        self.tag = tag
+        self.schedule_ids = schedule_ids_of(cfg)
+        self.scheduler = make_scheduler(cfg)
+        self.windows = make_oncall_windows(cfg)
+        self.watermark = make_watermark(cfg)
+        self.recent = RecentIds(cfg["recent_ttl"])
+        self.ratelimit = ratelimit
+        self.retry = RetryPolicy.from_config(cfg, tag)
+        self.shards = shards
+        self.shard = shard
+        self.store = store
+        self.user_id = ""  # set by start()
+        self.state = state
+        self.pending_cfg: dict | None = None
+        restore_state(self, state)
+
+    def reconfigure(self, cfg: dict):
+        """Take new settings; they are applied before the next cycle starts."""
+        self.pending_cfg = cfg
+
+    def start(self, user: dict):
+        self.user_id = user["id"]
+        all_incidents = self.cfg["all_incidents"]
+        self.user_ids = [] if all_incidents else [self.user_id]
+        log_start(self, user, ", async")
+
+    async def refresh_shards(self):
+        if self.shards is None or not self.shards.claim_refresh():
+            return
+        try:
+            self.shards.load(await self.pd.list_ids(self.client, self.shards.resource))
+        except Exception:
+            self.shards.release()
+            logger.warning(f"{self.tag}Failed to list {self.shards.resource}, keeping the old shards", exc_info=True)
+
+    async def cycle(self) -> float:
+        if self.pending_cfg is not None:
+            apply_config(self, self.pending_cfg)
+            self.pending_cfg = None
+        handled = 0
+        oncall = True
+        failed = None
+        deadline = time.monotonic() + self.scheduler.interval
+        try:
+            started = time.monotonic()
+            if self.schedule_ids:
+                oncall = await self.pd.is_user_oncall_cached(self.client, self.windows, self.user_id, self.schedule_ids)
+            metrics.CYCLE_PHASE_SECONDS.observe(time.monotonic() - started, phase="oncall")
+
+            if oncall:
+                await self.refresh_shards()
+            listings = shard_listings(self)
+            if not oncall:
+                logger.info(f"{self.tag}Not on-call, skipping")
+            elif not listings:
+                logger.debug(f"{self.tag}Nothing to list in this shard, skipping")
+            else:
+                started = time.monotonic()
+                since = self.watermark.since()
+                # The chunks of a shard's IDs are listed concurrently
+                results = await asyncio.gather(*(
+                    self.retry.call_async(
+                        "GET /incidents",
+                        lambda filters=filters, limit=limit: self.pd.get_incidents(
+                            self.client,
+                            user_ids=self.user_ids,
+                            limit=limit,
+                            since=since,
+                            sort_by=self.watermark.sort_by(since),
+                            **filters,
+                        ),
+                        deadline,
+                    )
+                    for filters, limit, _ in listings
+                ))
+                metrics.CYCLE_PHASE_SECONDS.observe(time.monotonic() - started, phase="list")
+                listed, marked, truncated = merge_listings(self, listings, results, since)
+                routed = skip_recent(self.recent, route_incidents(self.routes, listed), self.tag)
+
+                started = time.monotonic()
+                updates = updates_of(routed)
+                await self.retry.call_async(
+                    "PUT /incidents",
+                    lambda: self.pd.update_incidents(
+                        self.client, updates, max_concurrency=self.cfg["update_concurrency"]
+                    ),
+                    deadline,
+                )
+                handled = record_handled(self, routed, marked, since, truncated, time.monotonic() - started)
+                await asyncio.to_thread(store_handled, self, routed)
+        except Exception as e:
+            failed = e
+
+        await asyncio.to_thread(save_state, self)
+        interval = next_sleep(self.scheduler, handled, self.ratelimit, self.windows, oncall)
+        if failed is not None:
+            interval = self.retry.retry_in(interval, failed)
+            log_failure(self.tag, failed, interval)
+        logger.debug(f"{self.tag}Sleeping for {interval} seconds")
+        return interval
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(await self.cycle())
@@ -0,0 +1,179 @@
+"""Client-side rate limiting for PagerDuty REST API calls.
+
+Every request waits for a token from the :class:`Governor` of its API key before it is sent.
+Tokens refill at a rate tuned from the responses: a 429 halves it and pauses all requests
+for ``Retry-After`` seconds, the ``ratelimit-*`` headers cap it to what is left of the
+current window, and successful calls slowly bring it back up. When tokens are scarce,
+incident updates (ack/resolve) are served before listings, and listings before
+everything else (on-call checks, user lookups, schedule overrides).
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+from .transport import TransportAdapter
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_WRITE = 0
+PRIORITY_LIST = 1
+PRIORITY_BACKGROUND = 2
+
+# PagerDuty allows 960 REST requests per minute per user token
+RATE = 960 / 60
+BURST = 20
+MIN_RATE = 0.5
+
+
+def priority_for(method: str, url: str) -> int:
+    path = urlsplit(url).path.rstrip("/")
+    if path.endswith("/incidents") or path == "/incidents":
+        return PRIORITY_WRITE if method.upper() in ("PUT", "POST") else PRIORITY_LIST
+    return PRIORITY_BACKGROUND
+
+
+def _seconds(value) -> float | None:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class Governor:
+    """Thread-safe token bucket with priority ordering; usable from threads and asyncio."""
+
+    def __init__(self, rate: float = RATE, burst: int = BURST, min_rate: float = MIN_RATE):
+        self.max_rate = rate
+        self.min_rate = min_rate
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiting: list[tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _take(self, ticket) -> float:
+        """Take a token for ``ticket`` if it is first in line; otherwise return how long to wait."""
+        now = time.monotonic()
+        self._refill(now)
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._waiting[0] != ticket:
+            return 0.05
+        if self._tokens < 1:
+            return (1 - self._tokens) / self.rate
+        self._tokens -= 1
+        heapq.heappop(self._waiting)
+        self._cond.notify_all()
+        return 0.0
+
+    def _enqueue(self, priority: int):
+        ticket = (priority, next(self._seq))
+        heapq.heappush(self._waiting, ticket)
+        return ticket
+
+    def _abandon(self, ticket):
+        if ticket in self._waiting:
+            self._waiting.remove(ticket)
+            heapq.heapify(self._waiting)
+            self._cond.notify_all()
+
+    def acquire(self, priority: int = PRIORITY_BACKGROUND):
+        with self._cond:
+            ticket = self._enqueue(priority)
+            try:
+                while (delay := self._take(ticket)) > 0:
+                    self._cond.wait(delay)
+            except BaseException:
+                self._abandon(ticket)
+                raise
+
+    async def acquire_async(self, priority: int = PRIORITY_BACKGROUND):
+        with self._cond:
+            ticket = self._enqueue(priority)
+        try:
+            while True:
+                with self._cond:
+                    delay = self._take(ticket)
+                if delay <= 0:
+                    return
+                await asyncio.sleep(min(delay, 0.05))
+        except BaseException:
+            with self._cond:
+                self._abandon(ticket)
+            raise
+
+    def observe(self, status: int, headers):
+        with self._cond:
+            if status == 429:
+                pause = _seconds(headers.get("retry-after")) or _seconds(headers.get("ratelimit-reset")) or 1.0
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+                self._tokens = 0.0
+                self.rate = max(self.rate / 2, self.min_rate)
+                logger.info(f"Rate limited by PagerDuty, pausing requests for {pause:g}s at {self.rate:.2f} req/s")
+            else:
+                remaining = _seconds(headers.get("ratelimit-remaining"))
+                reset = _seconds(headers.get("ratelimit-reset"))
+                if remaining is not None and reset:
+                    self.rate = min(self.max_rate, max(self.min_rate, remaining / reset))
+                else:
+                    self.rate = min(self.max_rate, self.rate + self.min_rate)
+            self._cond.notify_all()
+
+
+class Governors:
+    """One governor per API key: PagerDuty rate-limits each token on its own."""
+
+    def __init__(self, **governor_kw):
+        self.governor_kw = governor_kw
+        self._governors = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str | None) -> Governor:
+        with self._lock:
+            if key not in self._governors:
+                self._governors[key] = Governor(**self.governor_kw)
+            return self._governors[key]
+
+
+class GovernedAdapter(TransportAdapter):
+    """``requests`` adapter that passes every request, retries included, through a governor."""
+
+    def __init__(self, governors: Governors, transport=None, **kw):
+        self.governors = governors
+        super().__init__(transport, **kw)
+
+    def send(self, request, **kw):
+        governor = self.governors.get(request.headers.get("Authorization"))
+        governor.acquire(priority_for(request.method, request.url))
+        response = super().send(request, **kw)
+        governor.observe(response.status_code, response.headers)
+        return response
+
+
+def trace_config(governors: Governors):
+    """aiohttp ``TraceConfig`` doing for the async client what GovernedAdapter does for requests."""
+    import aiohttp
+
+    async def on_request_start(session, context, params):
+        context.governor = governors.get(params.headers.get("Authorization"))
+        await context.governor.acquire_async(priority_for(params.method, str(params.url)))
+
+    async def on_request_end(session, context, params):
+        context.governor.observe(params.response.status, params.response.headers)
+
+    config = aiohttp.TraceConfig()
+    config.on_request_start.append(on_request_start)
+    config.on_request_end.append(on_request_end)
+    return config
@@ -0,0 +1,209 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from typing import IO
+
+logger = logging.getLogger(__name__)
+
+HISTORY_SIZE = 1000
+# Listings can still show an incident as triggered for a few seconds after we acked it
+RECENT_TTL = 120
+
+
+class HandledIncident:
+    """What we remember about an incident we acted on, instead of the full API dict."""
+
+    __slots__ = ("id", "number", "title", "service", "created_at", "handled_at")
+
+    def __init__(self, id, number, title, service, created_at, handled_at):
+        self.id = id
+        self.number = number
+        self.title = title
+        self.service = service
+        self.created_at = created_at
+        self.handled_at = handled_at
+
+    @classmethod
+    def from_incident(cls, incident: dict, handled_at: float | None = None) -> "HandledIncident":
+        return cls(
+            incident.get("id"),
+            incident.get("incident_number"),
+            incident.get("title", "N/A"),
+            (incident.get("service") or {}).get("id"),
+            incident.get("created_at"),
+            time.time() if handled_at is None else handled_at,
+        )
+
+    def to_list(self) -> list:
+        return [getattr(self, name) for name in self.__slots__]
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_list(), ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, line: str) -> "HandledIncident":
+        return cls(*json.loads(line))
+
+
+class History:
+    """Fixed-size ring buffer of handled incidents that spills the oldest ones to disk.
+
+    Memory stays bounded by ``capacity`` records however long the daemon runs, while
+    iterating still yields every incident handled in this run, oldest first. Overflow is
+    appended to ``spill_path`` (a temporary file when not given) one JSON line per record.
+    """
+
+    def __init__(self, capacity: int = HISTORY_SIZE, spill_path: str | None = None):
+        self.capacity = capacity
+        self.spill_path = spill_path
+        self._recent: deque[HandledIncident] = deque()
+        self._spilled = 0
+        self._spill_file: IO[str] | None = None
+        self._spill_offset = 0
+        self._lock = threading.Lock()
+
+    def _spill(self) -> IO[str]:
+        """The overflow file, opened on first use."""
+        if self._spill_file is None:
+            spill: IO[str]
+            if self.spill_path:
+                spill = open(self.spill_path, "a+", encoding="utf-8")
+            else:
+                spill = tempfile.TemporaryFile("a+", encoding="utf-8")
+            # Earlier runs may have appended to the same log; only read back our own records
+            spill.seek(0, os.SEEK_END)
+            self._spill_offset = spill.tell()
+            self._spill_file = spill
+        return self._spill_file
+
+    def extend(self, incidents: list):
+        handled_at = time.time()
+        with self._lock:
+            for incident in incidents:
+                self._recent.append(HandledIncident.from_incident(incident, handled_at))
+            overflow = len(self._recent) - self.capacity
+            if overflow > 0:
+                spill = self._spill()
+                spill.writelines(self._recent.popleft().to_json() + "\n" for _ in range(overflow))
+                spill.flush()
+                self._spilled += overflow
+
+    def append(self, incident: dict):
+        self.extend([incident])
+
+    def dump(self) -> list:
+        """The in-memory records, as lists; spilled ones are already on disk."""
+        with self._lock:
+            return [record.to_list() for record in self._recent]
+
+    def restore(self, records: list):
+        """Put records from :meth:`dump` back, before anything handled since."""
+        with self._lock:
+            restored = [HandledIncident(*values) for values in records[-self.capacity :]]
+            self._recent.extendleft(reversed(restored))
+            while len(self._recent) > self.capacity:
+                self._recent.pop()
+
+    def __len__(self) -> int:
+        return self._spilled + len(self._recent)
+
+    def __iter__(self):
+        """Stream the spilled records back from disk, then the in-memory ones.
+
+        Meant for the shutdown summary: records added while iterating may be missed.
+        """
+        with self._lock:
+            recent = list(self._recent)
+            spilled = self._spilled
+        if spilled:
+            spill = self._spill()
+            spill.seek(self._spill_offset)
+            for _ in range(spilled):
+                yield HandledIncident.from_json(spill.readline())
+        yield from recent
+
+    def close(self):
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+
+
+class RecentIds:
+    """Incidents acted on in the last ``ttl`` seconds, per action.
+
+    PagerDuty listings are eventually consistent, so an incident acknowledged in one cycle
+    may be listed again in the next; :meth:`fresh` drops those so they are neither sent
+    again nor counted twice. Entries are kept per action: an incident that was just
+    acknowledged can still be resolved by another route. ``ttl = 0`` turns this off.
+    """
+
+    def __init__(self, ttl: float = RECENT_TTL):
+        self.ttl = ttl
+        # (incident ID, action) -> expiry
+        self._expires: dict[tuple[str, str], float] = {}
+        # (expiry, key) in insertion order, which is also expiry order as the TTL is fixed
+        self._queue: deque[tuple[float, tuple[str, str]]] = deque()
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float):
+        while self._queue and self._queue[0][0] <= now:
+            expiry, key = self._queue.popleft()
+            if self._expires.get(key) == expiry:
+                del self._expires[key]
+
+    def add(self, incident_ids: list, action: str):
+        if not self.ttl:
+            return
+        now = time.monotonic()
+        expiry = now + self.ttl
+        with self._lock:
+            self._prune(now)
+            for incident_id in incident_ids:
+                self._expires[incident_id, action] = expiry
+                self._queue.append((expiry, (incident_id, action)))
+
+    def fresh(self, incidents: list, action: str) -> list:
+        """The incidents not acted on with ``action`` within the TTL."""
+        if not self.ttl:
+            return incidents
+        with self._lock:
+            self._prune(time.monotonic())
+            return [i for i in incidents if (i.get("id"), action) not in self._expires]
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._prune(time.monotonic())
+            return len(self._expires)
+
+    def dump(self) -> dict:
+        """action -> ID -> wall-clock expiry, which unlike the monotonic one survives a restart.
+
+        Rounded to whole seconds, so the dump only changes when entries do.
+        """
+        now = time.monotonic()
+        offset = time.time() - now
+        dumped: dict[str, dict[str, int]] = {}
+        with self._lock:
+            self._prune(now)
+            for (incident_id, action), expiry in self._expires.items():
+                dumped.setdefault(action, {})[incident_id] = round(expiry + offset)
+        return dumped
+
+    def restore(self, expiries: dict):
+        offset = time.monotonic() - time.time()
+        # State saved before entries were kept per action maps IDs straight to expiries;
+        # those entries are short-lived anyway, so they are dropped
+        entries = [
+            (expiry + offset, (incident_id, action))
+            for action, ids in expiries.items()
+            if isinstance(ids, dict)
+            for incident_id, expiry in ids.items()
+        ]
+        with self._lock:
+            for expiry, key in sorted(entries):
+                self._expires[key] = expiry
+                self._queue.append((expiry, key))
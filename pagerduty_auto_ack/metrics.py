@@ -0,0 +1,203 @@
+"""In-process metrics served in the Prometheus text format.
+
+Recording is always on and cheap; the HTTP endpoint is only started when a metrics port
+is configured.
+"""
+
+import bisect
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import pdpyras
+
+from .oncall import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[n]) for n in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def total(self) -> float:
+        with self._lock:
+            return sum(self._values.values())
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.label_names = labels
+        # label values -> [per-bucket counts (+Inf last), sum]
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[n]) for n in self.label_names)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0])
+            series[0][i] += 1
+            series[1] += value
+
+    def totals(self) -> tuple[int, float]:
+        """(count, sum) over all label values."""
+        with self._lock:
+            return sum(sum(counts) for counts, _ in self._series.values()), sum(t for _, t in self._series.values())
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    bucket_labels = _labels(self.label_names, key, f'le="{le}"')
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {total:g}")
+                lines.append(f"{self.name}_count{_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+TIME_TO_ACTION_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+CYCLE_PHASE_SECONDS = Histogram(
+    "pagerduty_auto_ack_cycle_phase_seconds",
+    "Duration of the on-call check, incident listing and update phases of a cycle.",
+    LATENCY_BUCKETS,
+    ("phase",),
+)
+API_REQUESTS = Counter(
+    "pagerduty_api_requests_total",
+    "PagerDuty API responses by endpoint and status, retried attempts included.",
+    ("endpoint", "status"),
+)
+API_REQUEST_SECONDS = Histogram(
+    "pagerduty_api_request_seconds",
+    "PagerDuty API response time by endpoint.",
+    LATENCY_BUCKETS,
+    ("endpoint",),
+)
+API_RETRIES = Counter(
+    "pagerduty_api_retries_total",
+    "PagerDuty API requests that had to be retried, by reason.",
+    ("reason",),
+)
+INCIDENTS_HANDLED = Counter(
+    "pagerduty_auto_ack_incidents_total",
+    "Incidents handled, by action.",
+    ("action",),
+)
+TIME_TO_ACTION_SECONDS = Histogram(
+    "pagerduty_auto_ack_time_to_action_seconds",
+    "Time from incident creation until we acknowledged or resolved it.",
+    TIME_TO_ACTION_BUCKETS,
+    ("action",),
+)
+HTTP_CONNECTIONS = Counter(
+    "pagerduty_http_connections_opened_total",
+    "New connections to the PagerDuty API; every other request reused a pooled one.",
+)
+HTTP_CONNECT_SECONDS = Histogram(
+    "pagerduty_http_connect_seconds",
+    "Time to open a connection to the PagerDuty API, TCP and TLS handshakes included.",
+    LATENCY_BUCKETS,
+)
+
+REGISTRY: list[Counter | Histogram] = [
+    CYCLE_PHASE_SECONDS,
+    API_REQUESTS,
+    API_REQUEST_SECONDS,
+    API_RETRIES,
+    INCIDENTS_HANDLED,
+    TIME_TO_ACTION_SECONDS,
+    HTTP_CONNECTIONS,
+    HTTP_CONNECT_SECONDS,
+]
+
+
+def endpoint_of(method: str, url: str) -> str:
+    """``GET /incidents/{id}`` style label, so IDs do not blow up the number of series."""
+    parts = urlsplit(url)
+    try:
+        path = pdpyras.canonical_path(f"{parts.scheme}://{parts.netloc}", url)
+    except pdpyras.URLError:
+        path = parts.path
+    return f"{method.upper()} {path}"
+
+
+def observe_response(method: str, url: str, status: int, elapsed: float):
+    endpoint = endpoint_of(method, url)
+    API_REQUESTS.inc(endpoint=endpoint, status=status)
+    API_REQUEST_SECONDS.observe(elapsed, endpoint=endpoint)
+    if status == 429:
+        API_RETRIES.inc(reason="rate_limited")
+
+
+def observe_connect(elapsed: float):
+    HTTP_CONNECTIONS.inc()
+    HTTP_CONNECT_SECONDS.observe(elapsed)
+
+
+def observe_handled(incidents: list, action: str, now: float | None = None):
+    now = time.time() if now is None else now
+    INCIDENTS_HANDLED.inc(len(incidents), action=action)
+    for incident in incidents:
+        created_at = incident.get("created_at")
+        if created_at:
+            TIME_TO_ACTION_SECONDS.observe(max(now - parse_timestamp(created_at, now), 0.0), action=action)
+
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+def make_server(host: str, port: int) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(f"metrics {self.address_string()} {format % args}")
+
+    return ThreadingHTTPServer((host, port), Handler)
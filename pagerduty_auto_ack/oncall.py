@@ -0,0 +1,105 @@
+import bisect
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+LOOKAHEAD = 24 * 3600
+MAX_AGE = 900
+
+
+def parse_timestamp(value: str | None, default: float) -> float:
+    """PagerDuty returns a null start/end for on-calls that are not bounded by a schedule."""
+    if not value:
+        return default
+    return datetime.fromisoformat(value).timestamp()
+
+
+def format_timestamp(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def merge_intervals(intervals: list) -> list:
+    merged: list[tuple[float, float]] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class OncallWindows:
+    """In-memory index of a user's on-call intervals for a lookahead window.
+
+    The owner fetches the intervals from ``/oncalls`` (see ``pd.get_oncall_windows``) whenever
+    :meth:`needs_refresh` says so and hands them to :meth:`load`; in between, "am I on call now"
+    is answered locally. The window is refetched when it runs out or after ``max_age`` seconds,
+    which picks up overrides created in the meantime.
+    """
+
+    def __init__(self, lookahead: float = LOOKAHEAD, max_age: float = MAX_AGE):
+        self.lookahead = lookahead
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._starts: list[float] = []
+        self._ends: list[float] = []
+        self._until = 0.0
+        self._fetched_at: float | None = None
+
+    def window(self, now: float | None = None) -> tuple[float, float]:
+        """The ``since``/``until`` range to fetch."""
+        now = time.time() if now is None else now
+        return now, now + self.lookahead
+
+    def load(self, intervals: list, since: float, until: float):
+        merged = merge_intervals([(max(s, since), min(e, until)) for s, e in intervals if e > since and s < until])
+        with self._lock:
+            self._starts = [s for s, _ in merged]
+            self._ends = [e for _, e in merged]
+            self._until = until
+            self._fetched_at = since
+        logger.debug(f"Cached {len(merged)} on-call windows until {format_timestamp(until)}")
+
+    def dump(self) -> dict:
+        with self._lock:
+            return {"starts": self._starts, "ends": self._ends, "until": self._until, "fetched_at": self._fetched_at}
+
+    def restore(self, state: dict):
+        """Reload windows from :meth:`dump`; timestamps are wall-clock, so they survive a restart."""
+        with self._lock:
+            self._starts = list(state["starts"])
+            self._ends = list(state["ends"])
+            self._until = state["until"]
+            self._fetched_at = state["fetched_at"]
+
+    def invalidate(self):
+        with self._lock:
+            self._fetched_at = None
+
+    def needs_refresh(self, now: float | None = None) -> bool:
+        now = time.time() if now is None else now
+        with self._lock:
+            return self._fetched_at is None or now >= self._until or now - self._fetched_at >= self.max_age
+
+    def is_oncall(self, now: float | None = None) -> bool:
+        now = time.time() if now is None else now
+        with self._lock:
+            i = bisect.bisect_right(self._starts, now) - 1
+            return i >= 0 and now < self._ends[i]
+
+    def seconds_until_change(self, now: float | None = None) -> float:
+        """Time until the on-call state flips or the cache has to be refreshed, whichever is first."""
+        now = time.time() if now is None else now
+        with self._lock:
+            if self._fetched_at is None:
+                return 0.0
+            change = min(self._until, self._fetched_at + self.max_age)
+            i = bisect.bisect_right(self._starts, now)
+            if i > 0 and now < self._ends[i - 1]:
+                change = min(change, self._ends[i - 1])
+            elif i < len(self._starts):
+                change = min(change, self._starts[i])
+        return max(change - now, 0.0)
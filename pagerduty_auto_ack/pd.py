@@ -1,47 +1,119 @@
+import contextvars
+import itertools
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 import pdpyras
 
+from . import metrics
+from .oncall import OncallWindows, format_timestamp, parse_timestamp
+from .scheduler import RateLimit
+from .transport import TransportAdapter
+
 logger = logging.getLogger(__name__)
 
+# PD API supports max of 250 updates at the same time
+MAX_UPDATE_BATCH = 250
+# Largest page size accepted by classic pagination
+MAX_PAGE_SIZE = 100
+
+
+class Session(pdpyras.APISession):
+    """APISession that records the rate-limit headers and metrics of every response."""
 
-def get_client(api_key: str):
-    return pdpyras.APISession(api_key)
+    def __init__(self, api_key: str, **kw):
+        super().__init__(api_key, **kw)
+        self.ratelimit = RateLimit()
+
+    def postprocess(self, response, suffix=None):
+        super().postprocess(response, suffix)
+        self.ratelimit.update(response.status_code, response.headers)
+        metrics.observe_response(
+            response.request.method, response.request.url, response.status_code, response.elapsed.total_seconds()
+        )
+
+
+def get_client(api_key: str, adapter: TransportAdapter | None = None, url: str | None = None) -> Session:
+    """Pass the same adapter to several clients to share one connection pool.
+
+    The client uses the adapter's timeouts. ``url`` overrides the API base URL, e.g.
+    ``https://api.eu.pagerduty.com``.
+    """
+    client = Session(api_key)
+    # RetryPolicy retries network errors and 5xx responses within the cycle's deadline;
+    # pdpyras retrying them too would multiply the time a failing call takes. 429 is
+    # still retried by pdpyras, paced by the governor.
+    client.max_network_attempts = 0
+    client.retry = {}
+    if url:
+        client.url = url
+    adapter = adapter or TransportAdapter()
+    client.mount("https://", adapter)
+    client.mount("http://", adapter)
+    client.timeout = adapter.transport.timeout
+    return client
 
 
 def get_current_user(client: pdpyras.APISession):
     return client.rget("users/me")
 
 
+def list_ids(client: pdpyras.APISession, resource: str) -> list:
+    """IDs of every object of a resource, e.g. all services of the account."""
+    return [item["id"] for item in client.iter_all(resource)]
+
+
 def get_incidents(
     client: pdpyras.APISession,
     user_ids=[],
     urgencies=[],
     statuses=["triggered"],
+    service_ids=[],
+    team_ids=[],
+    limit=None,
+    total=False,
+    since=None,
+    sort_by="incident_number:desc",
 ):
-    logger.debug("Listing incidents")
-
-    return client.rget(
+    """Lazily iterate over matching incidents.
+
+    Pages are only requested as the result is consumed, and no more than ``limit`` incidents
+    are yielded, so pages past the limit are never fetched. ``total`` asks the API to count
+    all matches, which costs the server extra work and is only needed for reporting.
+    ``since`` only lists incidents created at or after that ISO 8601 timestamp.
+    """
+    logger.debug(f"Listing incidents since {since}" if since else "Listing incidents")
+
+    params = {
+        "user_ids": user_ids,
+        "urgencies": urgencies,
+        "statuses": statuses,
+        "service_ids": service_ids,
+        "team_ids": team_ids,
+        "sort_by": sort_by,
+    }
+    if since:
+        params["since"] = since
+    incidents = client.iter_all(
         "incidents",
-        params={
-            "user_ids": user_ids,
-            "urgencies": urgencies,
-            "total": True,
-            "statuses": statuses,
-            "sort_by": "incident_number:desc",
-        },
+        params=params,
+        page_size=min(limit, MAX_PAGE_SIZE) if limit else MAX_PAGE_SIZE,
+        total=total,
     )
+    if limit:
+        return itertools.islice(incidents, limit)
+    return incidents
 
 
-def is_user_oncall(client: pdpyras.APISession, user_id: str, schedule_id: str) -> bool:
-    """检查用户当前是否在指定 schedule 上值班。"""
+def is_user_oncall(client: pdpyras.APISession, user_id: str, schedule_id: str | list) -> bool:
+    """检查用户当前是否在指定 schedule 上值班。传入多个 schedule 时，任意一个在值班即为 True。"""
     logger.debug(f"Checking oncall status for user {user_id} on schedule {schedule_id}")
     try:
         oncalls = client.rget(
             "oncalls",
             params={
                 "user_ids[]": [user_id],
-                "schedule_ids[]": [schedule_id],
+                "schedule_ids[]": [schedule_id] if isinstance(schedule_id, str) else list(schedule_id),
             },
         )
         return len(list(oncalls)) > 0
@@ -50,15 +122,47 @@ def is_user_oncall(client: pdpyras.APISession, user_id: str, schedule_id: str) -
         return True
 
 
-def _update_incidents(client: pdpyras.APISession, incident_ids=[], status="acknowledged"):
-    if not incident_ids:
-        logger.debug("No incidents to update")
-        return
+def get_oncall_windows(
+    client: pdpyras.APISession, user_id: str, schedule_id: str | list, since: float, until: float
+) -> list:
+    """返回用户在 since~until 之间的值班时间段 [(start, end), ...]（epoch 秒）。"""
+    logger.debug(f"Fetching oncall windows for user {user_id} on schedule {schedule_id}")
+    oncalls = client.iter_all(
+        "oncalls",
+        params={
+            "user_ids[]": [user_id],
+            "schedule_ids[]": [schedule_id] if isinstance(schedule_id, str) else list(schedule_id),
+            "since": format_timestamp(since),
+            "until": format_timestamp(until),
+        },
+    )
+    return [(parse_timestamp(o.get("start"), since), parse_timestamp(o.get("end"), until)) for o in oncalls]
+
+
+def is_user_oncall_cached(
+    client: pdpyras.APISession, windows: OncallWindows, user_id: str, schedule_id: str | list
+) -> bool:
+    """Like is_user_oncall, but only hits /oncalls when the cached windows need a refresh."""
+    if windows.needs_refresh():
+        since, until = windows.window()
+        try:
+            windows.load(get_oncall_windows(client, user_id, schedule_id, since, until), since, until)
+        except Exception:
+            logger.warning("Failed to fetch oncall windows, assuming on-call", exc_info=True)
+            return True
+    return windows.is_oncall()
 
+
+def batched(incident_ids: list, size: int = MAX_UPDATE_BATCH) -> list:
+    return [incident_ids[i : i + size] for i in range(0, len(incident_ids), size)]
+
+
+def _put_incidents(client: pdpyras.APISession, updates: list):
+    """``updates`` are (incident ID, new status) pairs; one request may mix statuses."""
     body = {
         "incidents": [
             {"id": incident_id, "type": "incident_reference", "status": status}
-            for incident_id in incident_ids
+            for incident_id, status in updates
         ]
     }
 
@@ -71,11 +175,35 @@ def _update_incidents(client: pdpyras.APISession, incident_ids=[], status="ackno
     )
 
 
-def acknowledge_incidents(client: pdpyras.APISession, incident_ids=[]):
+def update_incidents(client: pdpyras.APISession, updates=[], max_concurrency=1):
+    """Apply any number of (incident ID, new status) updates, sending up to ``max_concurrency`` batches at once."""
+    if not updates:
+        logger.debug("No incidents to update")
+        return
+
+    batches = batched(updates)
+    if len(batches) == 1:
+        return _put_incidents(client, batches[0])
+
+    logger.debug(f"Updating {len(updates)} incidents in {len(batches)} batches")
+    # Each batch runs in a copy of the caller's context, so a retry's deadline applies to all of them
+    contexts = [contextvars.copy_context() for _ in batches]
+    with ThreadPoolExecutor(max_workers=min(max_concurrency, len(batches))) as pool:
+        results = pool.map(
+            lambda context, batch: context.run(_put_incidents, client, batch), contexts, batches
+        )
+        return [incident for result in results for incident in result]
+
+
+def _update_incidents(client: pdpyras.APISession, incident_ids=[], status="acknowledged", max_concurrency=1):
+    return update_incidents(client, [(incident_id, status) for incident_id in incident_ids], max_concurrency)
+
+
+def acknowledge_incidents(client: pdpyras.APISession, incident_ids=[], max_concurrency=1):
     logger.debug("Acknowledging incidents")
-    return _update_incidents(client, incident_ids, status="acknowledged")
+    return _update_incidents(client, incident_ids, status="acknowledged", max_concurrency=max_concurrency)
 
 
-def resolve_incidents(client: pdpyras.APISession, incident_ids=[]):
+def resolve_incidents(client: pdpyras.APISession, incident_ids=[], max_concurrency=1):
     logger.debug("Resolving incidents")
-    return _update_incidents(client, incident_ids, status="resolved")
+    return _update_incidents(client, incident_ids, status="resolved", max_concurrency=max_concurrency)
@@ -0,0 +1,253 @@
+"""asyncio counterparts of the pdpyras wrappers in :mod:`pagerduty_auto_ack.pd`.
+
+All calls made through one client share a pooled ``aiohttp`` session, so independent
+requests (on-call checks, listings, updates) can be awaited concurrently.
+"""
+
+import asyncio
+import logging
+import time
+
+import aiohttp
+
+from . import metrics, transport
+from .governor import Governors, trace_config
+from .oncall import OncallWindows, format_timestamp, parse_timestamp
+from .pd import MAX_PAGE_SIZE, batched
+from .scheduler import RateLimit
+from .transport import Transport
+
+logger = logging.getLogger(__name__)
+
+BASE_URL = "https://api.pagerduty.com"
+API_VERSION_HEADER = "application/vnd.pagerduty+json;version=2"
+POOL_SIZE = 20
+
+
+def metrics_trace_config() -> aiohttp.TraceConfig:
+    async def on_request_start(session, context, params):
+        context.started = time.monotonic()
+
+    async def on_request_end(session, context, params):
+        elapsed = time.monotonic() - context.started
+        metrics.observe_response(params.method, str(params.url), params.response.status, elapsed)
+
+    config = aiohttp.TraceConfig()
+    config.on_request_start.append(on_request_start)
+    config.on_request_end.append(on_request_end)
+    return config
+
+
+def make_connector(pool_size: int = POOL_SIZE, keepalive: float = transport.KEEPALIVE) -> aiohttp.TCPConnector:
+    return aiohttp.TCPConnector(limit=pool_size, keepalive_timeout=keepalive)
+
+
+def get_client(
+    api_key: str,
+    pool_size: int = POOL_SIZE,
+    base_url: str = BASE_URL,
+    ratelimit: RateLimit | None = None,
+    connector: aiohttp.TCPConnector | None = None,
+    governors: Governors | None = None,
+    settings: Transport | None = None,
+) -> aiohttp.ClientSession:
+    """Must be created inside a running event loop; use as ``async with``.
+
+    When ``ratelimit`` is given it is updated from the headers of every response. Clients
+    created with the same ``connector`` share its connection pool; closing them leaves the
+    connector open for the others. With ``governors`` every request is rate limited like
+    the ones sent through ``governor.GovernedAdapter``. ``settings`` supplies the timeouts.
+    """
+    settings = settings or Transport()
+    trace_configs = [metrics_trace_config(), transport.trace_config()]
+    if governors is not None:
+        trace_configs.append(trace_config(governors))
+    if ratelimit is not None:
+
+        async def on_request_end(session, context, params):
+            ratelimit.update(params.response.status, params.response.headers)
+
+        ratelimit_trace = aiohttp.TraceConfig()
+        ratelimit_trace.on_request_end.append(on_request_end)
+        trace_configs.append(ratelimit_trace)
+
+    return aiohttp.ClientSession(
+        base_url=base_url,
+        connector=connector or make_connector(pool_size, settings.keepalive),
+        connector_owner=connector is None,
+        headers={
+            "Accept": API_VERSION_HEADER,
+            "Authorization": f"Token token={api_key}",
+            "Content-Type": "application/json",
+        },
+        raise_for_status=True,
+        timeout=aiohttp.ClientTimeout(sock_connect=settings.connect_timeout, sock_read=settings.read_timeout),
+        trace_configs=trace_configs,
+    )
+
+
+def _params(params: dict) -> list:
+    """Encode params the way pdpyras does: lists become repeated ``key[]`` entries."""
+    encoded = []
+    for key, value in params.items():
+        if isinstance(value, (list, tuple)):
+            name = key if key.endswith("[]") else f"{key}[]"
+            encoded += [(name, str(v)) for v in value]
+        elif isinstance(value, bool):
+            encoded.append((key, "true" if value else "false"))
+        else:
+            encoded.append((key, str(value)))
+    return encoded
+
+
+async def _get(client: aiohttp.ClientSession, path: str, wrapper: str, params={}):
+    async with client.get(f"/{path}", params=_params(params)) as response:
+        body = await response.json()
+    return body[wrapper]
+
+
+async def _get_all(client: aiohttp.ClientSession, path: str, wrapper: str, params={}, limit=None) -> list:
+    """Follow classic offset pagination until the API reports no ``more`` results or ``limit`` is reached."""
+    page_size = min(limit, MAX_PAGE_SIZE) if limit else MAX_PAGE_SIZE
+    results = []
+    offset = 0
+    while True:
+        page_params = _params({**params, "limit": page_size, "offset": offset})
+        async with client.get(f"/{path}", params=page_params) as response:
+            body = await response.json()
+        results += body[wrapper]
+        if limit and len(results) >= limit:
+            return results[:limit]
+        if not body.get("more") or not body[wrapper]:
+            return results
+        offset += len(body[wrapper])
+
+
+async def get_current_user(client: aiohttp.ClientSession) -> dict:
+    return await _get(client, "users/me", "user")
+
+
+async def list_ids(client: aiohttp.ClientSession, resource: str) -> list:
+    return [item["id"] for item in await _get_all(client, resource, resource)]
+
+
+async def get_incidents(
+    client: aiohttp.ClientSession,
+    user_ids=[],
+    urgencies=[],
+    statuses=["triggered"],
+    service_ids=[],
+    team_ids=[],
+    limit=None,
+    total=False,
+    since=None,
+    sort_by="incident_number:desc",
+) -> list:
+    logger.debug(f"Listing incidents since {since}" if since else "Listing incidents")
+
+    params = {
+        "user_ids": user_ids,
+        "urgencies": urgencies,
+        "total": total,
+        "statuses": statuses,
+        "service_ids": service_ids,
+        "team_ids": team_ids,
+        "sort_by": sort_by,
+    }
+    if since:
+        params["since"] = since
+    return await _get_all(client, "incidents", "incidents", params=params, limit=limit)
+
+
+async def is_user_oncall(client: aiohttp.ClientSession, user_id: str, schedule_id: str | list) -> bool:
+    """检查用户当前是否在指定 schedule 上值班。传入多个 schedule 时，任意一个在值班即为 True。"""
+    logger.debug(f"Checking oncall status for user {user_id} on schedule {schedule_id}")
+    try:
+        oncalls = await _get(
+            client,
+            "oncalls",
+            "oncalls",
+            params={
+                "user_ids[]": [user_id],
+                "schedule_ids[]": [schedule_id] if isinstance(schedule_id, str) else list(schedule_id),
+            },
+        )
+        return len(oncalls) > 0
+    except Exception:
+        logger.warning("Failed to check oncall status, assuming on-call", exc_info=True)
+        return True
+
+
+async def get_oncall_windows(
+    client: aiohttp.ClientSession, user_id: str, schedule_ids: list, since: float, until: float
+) -> list:
+    """返回用户在 since~until 之间的值班时间段 [(start, end), ...]（epoch 秒）。"""
+    logger.debug(f"Fetching oncall windows for user {user_id} on schedules {schedule_ids}")
+    oncalls = await _get_all(
+        client,
+        "oncalls",
+        "oncalls",
+        params={
+            "user_ids[]": [user_id],
+            "schedule_ids[]": schedule_ids,
+            "since": format_timestamp(since),
+            "until": format_timestamp(until),
+        },
+    )
+    return [(parse_timestamp(o.get("start"), since), parse_timestamp(o.get("end"), until)) for o in oncalls]
+
+
+async def is_user_oncall_cached(
+    client: aiohttp.ClientSession, windows: OncallWindows, user_id: str, schedule_ids: list
+) -> bool:
+    """Like is_user_oncall, but only hits /oncalls when the cached windows need a refresh."""
+    if windows.needs_refresh():
+        since, until = windows.window()
+        try:
+            windows.load(await get_oncall_windows(client, user_id, schedule_ids, since, until), since, until)
+        except Exception:
+            logger.warning("Failed to fetch oncall windows, assuming on-call", exc_info=True)
+            return True
+    return windows.is_oncall()
+
+
+async def _put_incidents(client: aiohttp.ClientSession, updates: list) -> list:
+    body = {
+        "incidents": [
+            {"id": incident_id, "type": "incident_reference", "status": status}
+            for incident_id, status in updates
+        ]
+    }
+
+    async with client.put("/incidents", params=_params({"total": True}), json=body) as response:
+        return (await response.json())["incidents"]
+
+
+async def update_incidents(client: aiohttp.ClientSession, updates=[], max_concurrency=1):
+    """Apply any number of (incident ID, new status) updates, sending up to ``max_concurrency`` batches at once."""
+    if not updates:
+        logger.debug("No incidents to update")
+        return
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def put(batch):
+        async with semaphore:
+            return await _put_incidents(client, batch)
+
+    results = await asyncio.gather(*(put(batch) for batch in batched(updates)))
+    return [incident for result in results for incident in result]
+
+
+async def _update_incidents(client: aiohttp.ClientSession, incident_ids=[], status="acknowledged", max_concurrency=1):
+    return await update_incidents(client, [(incident_id, status) for incident_id in incident_ids], max_concurrency)
+
+
+async def acknowledge_incidents(client: aiohttp.ClientSession, incident_ids=[], max_concurrency=1):
+    logger.debug("Acknowledging incidents")
+    return await _update_incidents(client, incident_ids, status="acknowledged", max_concurrency=max_concurrency)
+
+
+async def resolve_incidents(client: aiohttp.ClientSession, incident_ids=[], max_concurrency=1):
+    logger.debug("Resolving incidents")
+    return await _update_incidents(client, incident_ids, status="resolved", max_concurrency=max_concurrency)
@@ -0,0 +1,281 @@
+"""Retrying failed API calls within a cycle, and a circuit breaker for real outages.
+
+A call that fails with a 5xx, a timeout or a connection error is retried after a jittered,
+exponentially growing delay, but only while the retry still fits before the cycle's
+deadline (when the next cycle would start anyway): a retry is skipped when less than
+``MIN_ATTEMPT`` seconds would be left for it, and its request timeouts are cut to end at
+the deadline. A 429 is retried the same way, after at least its ``Retry-After``; the
+async client raises it like any other error, while pdpyras retries it itself, paced by
+the governor. Other errors (4xx, bad data) are raised at once. This is the only layer
+retrying network errors and 5xx responses: the clients themselves do not.
+
+Every 5xx, timeout or connection error counts towards the poller's :class:`CircuitBreaker`;
+429s and other errors show the API is up and leave it as it is. After ``threshold``
+failures in a row it opens: calls fail fast with :class:`CircuitOpenError` and the poller
+sleeps until ``cooldown`` has passed. Then a single probe request is let through; if it
+succeeds the breaker closes, if not it stays open for twice as long, up to ``max_cooldown``.
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+
+import pdpyras
+import requests
+
+from . import metrics
+from .transport import DEADLINE
+
+logger = logging.getLogger(__name__)
+
+ATTEMPTS = 4
+BACKOFF = 0.5
+MAX_BACKOFF = 8.0
+# A retry is only made when at least this many seconds are left before the deadline
+MIN_ATTEMPT = 1.0
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 5.0
+BREAKER_MAX_COOLDOWN = 300.0
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def status_of(exc: Exception) -> int | None:
+    """HTTP status of a pdpyras/requests (``response``) or aiohttp (``status``) error."""
+    response = getattr(exc, "response", None)
+    if response is not None:
+        return getattr(response, "status_code", None)
+    status = getattr(exc, "status", None)
+    return status if isinstance(status, int) else None
+
+
+def failure_reason(exc: Exception) -> str | None:
+    """Why ``exc`` is worth retrying, or None when retrying cannot help."""
+    status = status_of(exc)
+    if status == 429:
+        return "rate_limited"
+    if status is not None:
+        return "server_error" if status >= 500 else None
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError)):
+        return "network_error"
+    if isinstance(exc, pdpyras.PDClientError):
+        # pdpyras gives up on network errors with a PDClientError that has no response
+        return "network_error"
+    try:
+        import aiohttp
+    except ImportError:
+        return None
+    if isinstance(exc, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)):
+        return "network_error"
+    return None
+
+
+def retry_after(exc: Exception) -> float:
+    """Seconds the response behind ``exc`` asked to wait (``Retry-After``), 0 if it did not say."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response if response is not None else exc, "headers", None) or {}
+    try:
+        return max(float(headers.get("retry-after", 0)), 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        threshold: int = BREAKER_THRESHOLD,
+        cooldown: float = BREAKER_COOLDOWN,
+        max_cooldown: float = BREAKER_MAX_COOLDOWN,
+        tag: str = "",
+    ):
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.tag = tag
+        self.state = CLOSED
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now; while half-open only one at a time may."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.cooldown:
+                    return False
+                self.state = HALF_OPEN
+                self._probing = False
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info(f"{self.tag}PagerDuty API reachable again, closing circuit breaker")
+            self.state = CLOSED
+            self.cooldown = self.base_cooldown
+            self._failures = 0
+            self._probing = False
+
+    def release(self):
+        """End a probe whose answer says nothing about an outage; the next request probes again."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == HALF_OPEN:
+                self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            elif self.state == OPEN or self._failures < self.threshold:
+                return
+            self.state = OPEN
+            self._opened_at = time.monotonic()
+            self._probing = False
+            logger.warning(
+                f"{self.tag}{self._failures} failed requests in a row, pausing API calls for {self.cooldown:g}s"
+            )
+
+    def seconds_until_probe(self) -> float:
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(self.cooldown - (time.monotonic() - self._opened_at), 0.0)
+
+
+class RetryPolicy:
+    """Retries one poller's API calls and feeds their outcome to its circuit breaker."""
+
+    def __init__(
+        self,
+        attempts: int = ATTEMPTS,
+        backoff: float = BACKOFF,
+        breaker: CircuitBreaker | None = None,
+        max_backoff: float = MAX_BACKOFF,
+    ):
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+
+    @classmethod
+    def from_config(cls, cfg: dict, tag: str = "") -> "RetryPolicy":
+        policy = cls(breaker=CircuitBreaker(tag=tag))
+        policy.configure(cfg)
+        return policy
+
+    def configure(self, cfg: dict):
+        """Apply (reloaded) settings; the breaker keeps its state."""
+        self.attempts = cfg["retry_attempts"]
+        self.backoff = cfg["retry_backoff"]
+        self.breaker.threshold = cfg["breaker_threshold"]
+        self.breaker.base_cooldown = cfg["breaker_cooldown"]
+        self.breaker.max_cooldown = cfg["breaker_max_cooldown"]
+
+    def delay(self, attempt: int) -> float:
+        """Full jitter: uniform between zero and the exponential backoff for this attempt."""
+        return random.uniform(0, min(self.backoff * 2**attempt, self.max_backoff))
+
+    def retry_in(self, interval: float, exc: Exception) -> float:
+        """How soon a cycle that failed with ``exc`` should run again.
+
+        At the breaker's next probe when it is open; after its cooldown, if that is sooner
+        than ``interval``, when the API looked down. Anything else (4xx, 429, bugs) would
+        only fail again sooner, so it waits the full ``interval``.
+        """
+        if self.breaker.state == OPEN:
+            return max(self.breaker.seconds_until_probe(), 1.0)
+        if failure_reason(exc) in ("server_error", "network_error"):
+            return min(interval, max(self.breaker.base_cooldown, 1.0))
+        return interval
+
+    def _before(self, endpoint: str):
+        if not self.breaker.allow():
+            wait = self.breaker.seconds_until_probe()
+            raise CircuitOpenError(f"Circuit breaker open, skipping {endpoint} (next probe in {wait:.0f}s)")
+
+    def _after_failure(self, endpoint: str, exc: Exception, attempt: int, deadline: float) -> float | None:
+        """Delay before the next attempt, or None to give up and re-raise."""
+        reason = failure_reason(exc)
+        if reason in (None, "rate_limited"):
+            # The API answered, which says nothing about whether it is down
+            self.breaker.release()
+        else:
+            self.breaker.record_failure()
+        if reason is None:
+            return None
+        delay = max(self.delay(attempt), retry_after(exc))
+        if (
+            attempt + 1 >= self.attempts
+            or time.monotonic() + delay + MIN_ATTEMPT > deadline
+            or self.breaker.state != CLOSED
+        ):
+            return None
+        if reason != "rate_limited":
+            # 429 responses are counted as they come in, see metrics.observe_response
+            metrics.API_RETRIES.inc(reason=reason)
+        cause = status_of(exc) or type(exc).__name__
+        logger.info(f"{self.breaker.tag}{endpoint} failed ({cause}), retrying in {delay:.1f}s")
+        return delay
+
+    def call(self, endpoint: str, fn, deadline: float):
+        """Call ``fn()`` until it succeeds, retrying until ``deadline`` (``time.monotonic()``).
+
+        Retries run with :data:`~pagerduty_auto_ack.transport.DEADLINE` set, so their
+        requests time out by ``deadline``.
+        """
+        attempt = 0
+        while True:
+            self._before(endpoint)
+            token = DEADLINE.set(deadline) if attempt else None
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self._after_failure(endpoint, e, attempt, deadline)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+            else:
+                self.breaker.record_success()
+                return result
+            finally:
+                if token is not None:
+                    DEADLINE.reset(token)
+
+    async def call_async(self, endpoint: str, fn, deadline: float):
+        """Like :meth:`call`; ``fn()`` returns a new awaitable on every attempt.
+
+        Retries are cancelled at ``deadline`` and count as timeouts.
+        """
+        attempt = 0
+        while True:
+            self._before(endpoint)
+            try:
+                if attempt:
+                    result = await asyncio.wait_for(fn(), max(deadline - time.monotonic(), MIN_ATTEMPT))
+                else:
+                    result = await fn()
+            except Exception as e:
+                delay = self._after_failure(endpoint, e, attempt, deadline)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+            else:
+                self.breaker.record_success()
+                return result
@@ -0,0 +1,147 @@
+"""Rules choosing which incidents an action applies to.
+
+A rule is a table of conditions that must all hold::
+
+    services = ["PSVC123"]         # service IDs
+    teams = ["PTEAM45"]            # team IDs
+    priorities = ["P1", "P2"]      # priority names or IDs
+    urgencies = ["high"]
+    title = "disk .* full"         # regular expression, searched in the title
+
+A list of rules matches an incident when any of its rules does; an empty list matches
+every incident. Rules are compiled once into a :class:`Matcher`: rules with a single
+condition are merged into one set per field (and one regex for titles), rules with several
+are indexed by service ID, so matching costs a few hash lookups per incident however many
+rules there are.
+"""
+
+import re
+
+SET_FIELDS = ("services", "teams", "priorities", "urgencies")
+FIELDS = SET_FIELDS + ("title",)
+
+# Fields the incidents listing can filter on, and the query parameter for each
+PUSHDOWN_PARAMS = {"services": "service_ids", "teams": "team_ids", "urgencies": "urgencies"}
+
+
+def facts_of(incident: dict) -> tuple:
+    """(service ID, team IDs, priority name and ID, urgency, title) of an incident."""
+    priority = incident.get("priority") or {}
+    return (
+        (incident.get("service") or {}).get("id"),
+        [team.get("id") for team in incident.get("teams") or []],
+        (priority.get("summary") or priority.get("name"), priority.get("id")),
+        incident.get("urgency"),
+        incident.get("title") or "",
+    )
+
+
+class Rule:
+    __slots__ = FIELDS
+
+    services: frozenset | None
+    teams: frozenset | None
+    priorities: frozenset | None
+    urgencies: frozenset | None
+    title: re.Pattern | None
+
+    def __init__(self, spec: dict):
+        if not isinstance(spec, dict):
+            raise ValueError(f"a rule must be a table, got {spec!r}")
+        unknown = set(spec) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"unknown rule field(s) {', '.join(sorted(unknown))} (choose from {', '.join(FIELDS)})")
+        for field in SET_FIELDS:
+            values = spec.get(field)
+            if isinstance(values, str):
+                values = [values]
+            if values is not None and (not isinstance(values, list) or not all(isinstance(v, str) for v in values)):
+                raise ValueError(f"{field} must be a string or a list of strings, got {values!r}")
+            if values == []:
+                # Would silently match every incident; leave the field out for that
+                raise ValueError(f"{field} is empty, leave it out to match any value")
+            setattr(self, field, frozenset(values) if values else None)
+        if "title" in spec and not isinstance(spec["title"], str):
+            raise ValueError(f"title must be a string, got {spec['title']!r}")
+        try:
+            self.title = re.compile(spec["title"]) if spec.get("title") else None
+        except re.error as e:
+            raise ValueError(f"bad title regex {spec['title']!r}: {e}") from None
+
+    def conditions(self) -> list:
+        return [field for field in FIELDS if getattr(self, field) is not None]
+
+    def matches(self, facts: tuple) -> bool:
+        service, teams, priorities, urgency, title = facts
+        return (
+            (self.services is None or service in self.services)
+            and (self.teams is None or not self.teams.isdisjoint(teams))
+            and (self.priorities is None or not self.priorities.isdisjoint(priorities))
+            and (self.urgencies is None or urgency in self.urgencies)
+            and (self.title is None or self.title.search(title) is not None)
+        )
+
+
+class Matcher:
+    def __init__(self, specs: list):
+        if not isinstance(specs, list):
+            raise ValueError(f"rules must be a list of tables, got {specs!r}")
+        self.rules = [Rule(spec) for spec in specs]
+        self.match_all = not self.rules or any(not rule.conditions() for rule in self.rules)
+
+        self._sets: dict[str, set[str]] = {field: set() for field in SET_FIELDS}
+        titles = []
+        self._by_service: dict[str, list[Rule]] = {}
+        self._scan = []
+        for rule in self.rules:
+            conditions = rule.conditions()
+            if len(conditions) == 1 and conditions[0] == "title":
+                titles.append(rule.title)
+            elif len(conditions) == 1:
+                self._sets[conditions[0]] |= getattr(rule, conditions[0])
+            elif rule.services is not None:
+                for service in rule.services:
+                    self._by_service.setdefault(service, []).append(rule)
+            else:
+                self._scan.append(rule)
+        self._titles = self._compile_titles(titles)
+
+    @staticmethod
+    def _compile_titles(titles: list) -> list:
+        if len(titles) < 2:
+            return titles
+        try:
+            return [re.compile("|".join(f"(?:{title.pattern})" for title in titles))]
+        except re.error:
+            # e.g. global inline flags like (?i) anywhere but at the very start
+            return titles
+
+    def matches(self, incident: dict) -> bool:
+        if self.match_all:
+            return True
+        facts = facts_of(incident)
+        service, teams, priorities, urgency, title = facts
+        sets = self._sets
+        if (
+            service in sets["services"]
+            or urgency in sets["urgencies"]
+            or not sets["teams"].isdisjoint(teams)
+            or not sets["priorities"].isdisjoint(priorities)
+            or any(regex.search(title) for regex in self._titles)
+        ):
+            return True
+        if any(rule.matches(facts) for rule in self._by_service.get(service, ())):
+            return True
+        return any(rule.matches(facts) for rule in self._scan)
+
+    def pushdown(self) -> dict:
+        """Values per filterable field that every rule restricts, i.e. server-side filters
+        that cannot drop an incident one of the rules would match."""
+        if self.match_all:
+            return {}
+        pushed = {}
+        for field in PUSHDOWN_PARAMS:
+            values = [getattr(rule, field) for rule in self.rules]
+            if all(v is not None for v in values):
+                pushed[field] = frozenset().union(*values)
+        return pushed
@@ -0,0 +1,77 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimit:
+    """Last rate-limit state reported by the API (``ratelimit-*`` headers, 429 responses)."""
+
+    def __init__(self):
+        self.limit = None
+        self.remaining = None
+        self.reset = None
+
+    def update(self, status: int, headers):
+        if status != 429 and "ratelimit-remaining" not in headers:
+            # A successful response without headers ends an earlier 429 back-off
+            self.remaining = self.reset = None
+            return
+        try:
+            if "ratelimit-limit" in headers:
+                self.limit = int(headers["ratelimit-limit"])
+            if "ratelimit-remaining" in headers:
+                self.remaining = int(headers["ratelimit-remaining"])
+            if "ratelimit-reset" in headers:
+                self.reset = float(headers["ratelimit-reset"])
+        except ValueError:
+            logger.debug("Ignoring malformed rate-limit headers", exc_info=True)
+        if status == 429:
+            self.remaining = 0
+            if "retry-after" in headers:
+                try:
+                    self.reset = float(headers["retry-after"])
+                except ValueError:
+                    pass
+
+    @property
+    def headroom(self) -> float | None:
+        """Fraction of the rate limit still available, None until the API has reported it."""
+        if self.remaining is None:
+            return None
+        if not self.limit:
+            return 0.0 if self.remaining == 0 else None
+        return self.remaining / self.limit
+
+
+class AdaptiveScheduler:
+    """Pick the sleep between cycles from recent incident activity and rate-limit headroom.
+
+    Polls at ``min_interval`` right after incidents were handled, multiplies the interval by
+    ``backoff`` after every quiet cycle up to ``max_interval``, and backs off the same way when
+    less than ``headroom_threshold`` of the rate limit is left. With equal bounds it behaves
+    like the fixed interval.
+    """
+
+    def __init__(self, min_interval: float, max_interval: float, backoff: float = 2.0, headroom_threshold: float = 0.2):
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError(f"invalid interval bounds: min={min_interval}, max={max_interval}")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.headroom_threshold = headroom_threshold
+        self.interval = min_interval
+
+    def observe(self, handled: int, ratelimit: RateLimit | None = None) -> float:
+        """Record the outcome of a cycle and return how long to sleep before the next one."""
+        if handled:
+            interval = self.min_interval
+        else:
+            interval = self.interval * self.backoff
+
+        headroom = ratelimit.headroom if ratelimit else None
+        if ratelimit is not None and headroom is not None and headroom < self.headroom_threshold:
+            interval = max(interval, self.interval * self.backoff, ratelimit.reset or 0)
+            logger.debug(f"Low rate-limit headroom ({headroom:.0%}), slowing down")
+
+        self.interval = min(max(interval, self.min_interval), self.max_interval)
+        return self.interval
@@ -0,0 +1,119 @@
+"""Splitting one user's incidents into partitions by service or team, each polled on its own.
+
+Every service (or team) ID belongs to shard ``crc32(id) % count``, so the partitions do
+not change when services are added or removed. A shard lists incidents with
+``service_ids[]`` (``team_ids[]``) set to its own IDs, at most ``MAX_IDS`` per request
+so the URL stays short; when the rules already restrict the listing to some services,
+those are partitioned, otherwise the account's services, which are listed again every
+``refresh`` seconds to pick up new ones.
+
+In the latter case shard 0 also lists the newest ``CATCH_ALL_LIMIT`` incidents without
+the ID filter and takes those on none of the known IDs: services created since the last
+refresh (which is then brought forward) and, by team, incidents without a team.
+
+An incident with several teams is listed by every shard owning one of them, but only
+handled by the shard of its lowest known team ID.
+"""
+
+import threading
+import time
+import zlib
+
+# Seconds before the account's services or teams are listed again
+REFRESH = 300
+
+# Seconds after a refresh before incidents on unknown IDs make the next one come early
+EARLY_REFRESH = 30
+
+# IDs per listing request; thousands of them risk a 414 URI Too Long
+MAX_IDS = 100
+
+# Incidents shard 0 lists without the ID filter each cycle, newest first: one page
+CATCH_ALL_LIMIT = 100
+
+# shard_by -> (listing parameter, API resource listing the IDs)
+SHARD_BY = {
+    "service": ("service_ids", "services"),
+    "team": ("team_ids", "teams"),
+}
+
+
+class Shards:
+    def __init__(self, by: str = "service", count: int = 1, refresh: float = REFRESH):
+        self.by = by
+        self.count = count
+        self.refresh = refresh
+        self.param, self.resource = SHARD_BY[by]
+        self.ids: list[str] = []
+        self._loaded: float | None = None
+        self._expired = False
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def claim_refresh(self) -> bool:
+        """True for the one caller that should list the IDs again now; call :meth:`load` or :meth:`release` after."""
+        with self._lock:
+            if self._refreshing:
+                return False
+            refresh = min(self.refresh, EARLY_REFRESH) if self._expired else self.refresh
+            if self._loaded is not None and time.monotonic() - self._loaded < refresh:
+                return False
+            self._refreshing = True
+            return True
+
+    def load(self, ids: list):
+        with self._lock:
+            self.ids = sorted(ids)
+            self._loaded = time.monotonic()
+            self._expired = False
+            self._refreshing = False
+
+    def expire(self):
+        """Refresh early, incidents turned up on IDs the last refresh did not know about."""
+        with self._lock:
+            self._expired = True
+
+    def release(self):
+        """Give up a refresh that failed; the old IDs stay in use and the next cycle tries again."""
+        with self._lock:
+            self._refreshing = False
+
+    def shard_of(self, id: str) -> int:
+        return zlib.crc32(id.encode()) % self.count
+
+    def known(self, ids: list | None = None) -> frozenset:
+        """The IDs being partitioned: ``ids`` if the rules give some, otherwise all the account's."""
+        with self._lock:
+            return frozenset(ids or self.ids)
+
+    def partition(self, index: int, ids: list | None = None) -> list:
+        """Shard ``index``'s share of ``ids``, or of all the account's IDs."""
+        return sorted(id for id in self.known(ids) if self.shard_of(id) == index)
+
+    def ids_of(self, incident: dict) -> list:
+        if self.by == "service":
+            ids = [(incident.get("service") or {}).get("id")]
+        else:
+            ids = [team.get("id") for team in incident.get("teams") or []]
+        return [id for id in ids if id]
+
+    def owned(self, index: int, incidents: list, ids: list | None = None) -> list:
+        """The incidents shard ``index`` handles: those whose lowest known ID is in its share.
+
+        Incidents on none of the known IDs go to shard 0; only its catch-all listing returns
+        them, and unless they have no ID at all they bring the next refresh forward.
+        """
+        known = self.known(ids)
+        owned = []
+        for incident in incidents:
+            incident_ids = self.ids_of(incident)
+            known_ids = [id for id in incident_ids if id in known]
+            if known_ids:
+                shard = self.shard_of(min(known_ids))
+            else:
+                shard = 0
+                if incident_ids and index == 0:
+                    self.expire()
+            if shard == index:
+                owned.append(incident)
+        return owned
@@ -0,0 +1,86 @@
+"""Warm-restart state, so a daemon restarted after a crash does not start cold.
+
+The state file keeps, per API key (stored as a hash, never the key itself), the ``users/me``
+identity and, per poller, the incident high-water mark, the cached on-call windows, the
+recently handled incident IDs and the in-memory part of the history. It is rewritten
+atomically after every cycle that changed something.
+"""
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+STATE_VERSION = 2
+
+
+def key_id(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+class StateFile:
+    def __init__(self, path: str):
+        self.path = path
+        self._data: dict = {"version": STATE_VERSION, "users": {}, "pollers": {}}
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            logger.warning(f"Ignoring unreadable state file {self.path}", exc_info=True)
+            return
+        if not isinstance(data, dict) or data.get("version") != STATE_VERSION:
+            logger.warning(f"Ignoring state file {self.path} written by another version")
+            return
+        with self._lock:
+            self._data = data
+        logger.info(f"Loaded state for {len(data.get('pollers', {}))} pollers from {self.path}")
+
+    def user(self, api_key: str) -> dict | None:
+        with self._lock:
+            return self._data["users"].get(key_id(api_key))
+
+    def set_user(self, api_key: str, user: dict):
+        self._set("users", key_id(api_key), user)
+
+    def poller(self, api_key: str, action: str) -> dict | None:
+        with self._lock:
+            return self._data["pollers"].get(f"{key_id(api_key)}:{action}")
+
+    def set_poller(self, api_key: str, action: str, state: dict):
+        self._set("pollers", f"{key_id(api_key)}:{action}", state)
+
+    def _set(self, section: str, key: str, value: dict):
+        with self._lock:
+            if self._data[section].get(key) != value:
+                self._data[section][key] = value
+                self._dirty = True
+
+    def save(self):
+        """Write the state if it changed; a crash mid-write leaves the previous file intact."""
+        with self._lock:
+            if not self._dirty:
+                return
+            tmp_path = None
+            try:
+                fd, tmp_path = tempfile.mkstemp(prefix=".state-", dir=os.path.dirname(os.path.abspath(self.path)))
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(self._data, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                logger.warning(f"Failed to write state file {self.path}", exc_info=True)
+                if tmp_path:
+                    with contextlib.suppress(OSError):
+                        os.unlink(tmp_path)
+                return
+            self._dirty = False
@@ -0,0 +1,120 @@
+"""SQLite log of every incident the daemon acknowledged or resolved, and reports over it.
+
+Each cycle's incidents are written in one transaction. The database runs in WAL mode, so
+``pagerduty-auto-ack report`` can read it while the daemon (or several daemons, e.g. the
+ack and resolve scripts) keep writing. Reports are answered from covering indexes: counts
+per day scan a ``handled_at`` range, and a percentile is a single ``OFFSET`` into the
+``(action, latency_ms)`` index, so they stay fast with millions of rows.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+
+from .oncall import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS handled (
+    incident_id TEXT NOT NULL,
+    number INTEGER,
+    title TEXT,
+    service_id TEXT,
+    urgency TEXT,
+    action TEXT NOT NULL,
+    created_at REAL,
+    handled_at REAL NOT NULL,
+    -- handled_at - created_at; NULL when the incident had no created_at
+    latency_ms INTEGER
+);
+CREATE INDEX IF NOT EXISTS handled_incident ON handled (incident_id);
+CREATE INDEX IF NOT EXISTS handled_time ON handled (handled_at, service_id, action);
+CREATE INDEX IF NOT EXISTS handled_service ON handled (service_id, handled_at);
+CREATE INDEX IF NOT EXISTS handled_urgency ON handled (urgency, handled_at);
+CREATE INDEX IF NOT EXISTS handled_latency ON handled (action, latency_ms, handled_at);
+"""
+
+PERCENTILES = (50, 90, 99)
+
+
+def row_of(incident: dict, action: str, handled_at: float) -> tuple:
+    created_at = parse_timestamp(incident.get("created_at"), handled_at) if incident.get("created_at") else None
+    latency_ms = round(max(handled_at - created_at, 0.0) * 1000) if created_at is not None else None
+    return (
+        incident.get("id"),
+        incident.get("incident_number"),
+        incident.get("title"),
+        (incident.get("service") or {}).get("id"),
+        incident.get("urgency"),
+        action,
+        created_at,
+        handled_at,
+        latency_ms,
+    )
+
+
+class IncidentStore:
+    """One connection shared by all pollers; writes are serialized by a lock."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode = WAL")
+        self._db.execute("PRAGMA synchronous = NORMAL")
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def add(self, handled: list, handled_at: float | None = None):
+        """Write (action, incidents) pairs in one transaction."""
+        handled_at = time.time() if handled_at is None else handled_at
+        rows = [row_of(incident, action, handled_at) for action, incidents in handled for incident in incidents]
+        if not rows:
+            return
+        with self._lock:
+            try:
+                self._db.execute("BEGIN")
+                self._db.executemany("INSERT INTO handled VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                self._db.execute("COMMIT")
+            except sqlite3.Error:
+                if self._db.in_transaction:
+                    self._db.execute("ROLLBACK")
+                logger.warning(f"Failed to write {len(rows)} incidents to {self.path}", exc_info=True)
+
+    def _query(self, sql: str, params: tuple) -> list:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def daily_counts(self, since: float, action: str | None = None) -> list:
+        """(UTC day, service ID, action, count) rows, newest day first."""
+        return self._query(
+            """
+            SELECT date(handled_at, 'unixepoch') AS day, service_id, action, count(*)
+            FROM handled
+            WHERE handled_at >= ? AND (? IS NULL OR action = ?)
+            GROUP BY day, service_id, action
+            ORDER BY day DESC, count(*) DESC
+            """,
+            (since, action, action),
+        )
+
+    def latency_percentiles(self, since: float, action: str, percentiles: tuple = PERCENTILES) -> tuple:
+        """(count, {percentile: milliseconds}, max) of the time from creation to ``action``."""
+        where = "action = ? AND latency_ms IS NOT NULL AND handled_at >= ?"
+        [(count, longest)] = self._query(
+            f"SELECT count(*), max(latency_ms) FROM handled WHERE {where}", (action, since)
+        )
+        values = {}
+        for p in percentiles if count else ():
+            # Nearest rank
+            offset = max(-(-count * p // 100) - 1, 0)
+            [(values[p],)] = self._query(
+                f"SELECT latency_ms FROM handled WHERE {where} ORDER BY latency_ms LIMIT 1 OFFSET ?",
+                (action, since, offset),
+            )
+        return count, values, longest
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,131 @@
+"""HTTP transport settings shared by every PagerDuty client: pool size and timeouts.
+
+Connections are kept alive and reused across cycles. Every new connection is counted and
+its TCP and TLS handshake timed (``pagerduty_http_connections_opened_total`` and
+``pagerduty_http_connect_seconds``), so the handshakes saved by pooling can be measured;
+``benchmarks/bench_cycle.py`` reports them per cycle. Neither ``requests`` nor ``aiohttp``
+speak HTTP/2, so keep-alive HTTP/1.1 is what is tuned here.
+
+Nothing is retried at this layer, not even connections that could not be opened: failed
+requests are retried by :class:`~pagerduty_auto_ack.retry.RetryPolicy`, the one layer that
+knows when the next cycle starts. While it retries, :data:`DEADLINE` is set and the
+adapter shortens the timeouts so the request cannot run past it.
+"""
+
+import contextvars
+import logging
+import time
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = 10
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 30.0
+# Longer than a typical polling interval, so idle connections survive until the next cycle
+KEEPALIVE = 120.0
+# Shortest timeout a request gets however close the deadline is
+MIN_TIMEOUT = 1.0
+
+# time.monotonic() by which requests made in this context must be done, or None
+DEADLINE: contextvars.ContextVar[float | None] = contextvars.ContextVar("deadline", default=None)
+
+
+def capped_timeout(timeout, deadline: float | None):
+    """``timeout`` (seconds or a (connect, read) pair) shortened to end by ``deadline``."""
+    if deadline is None or timeout is None:
+        return timeout
+    left = max(deadline - time.monotonic(), MIN_TIMEOUT)
+    if isinstance(timeout, tuple):
+        return tuple(None if t is None else min(t, left) for t in timeout)
+    return min(timeout, left)
+
+
+class Transport:
+    def __init__(
+        self,
+        pool_size: int = POOL_SIZE,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+        keepalive: float = KEEPALIVE,
+    ):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.keepalive = keepalive
+
+    @classmethod
+    def from_config(cls, cfg: dict) -> "Transport":
+        return cls(
+            pool_size=cfg["pool_size"] or cfg["workers"] * cfg["update_concurrency"],
+            connect_timeout=cfg["connect_timeout"],
+            read_timeout=cfg["read_timeout"],
+        )
+
+    @property
+    def timeout(self) -> tuple[float, float]:
+        return self.connect_timeout, self.read_timeout
+
+
+class _TimedConnect:
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        metrics.observe_connect(time.perf_counter() - started)
+
+
+class _TimedHTTPConnection(_TimedConnect, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnect, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TransportAdapter(HTTPAdapter):
+    """``requests`` adapter applying a :class:`Transport`; requests without a timeout get its timeouts,
+    and no request waits past :data:`DEADLINE`."""
+
+    def __init__(self, transport: Transport | None = None, **kw):
+        self.transport = transport or Transport()
+        kw.setdefault("pool_maxsize", self.transport.pool_size)
+        super().__init__(**kw)
+
+    def init_poolmanager(self, *args, **kw):
+        super().init_poolmanager(*args, **kw)
+        self.poolmanager.pool_classes_by_scheme = {"http": _TimedHTTPConnectionPool, "https": _TimedHTTPSConnectionPool}
+
+    def send(self, request, **kw):
+        if kw.get("timeout") is None:
+            kw["timeout"] = self.transport.timeout
+        kw["timeout"] = capped_timeout(kw["timeout"], DEADLINE.get())
+        return super().send(request, **kw)
+
+
+def trace_config():
+    """aiohttp ``TraceConfig`` recording new connections like the requests adapter does."""
+    import aiohttp
+
+    async def on_connection_create_start(session, context, params):
+        context.connect_started = time.perf_counter()
+
+    async def on_connection_create_end(session, context, params):
+        metrics.observe_connect(time.perf_counter() - context.connect_started)
+
+    config = aiohttp.TraceConfig()
+    config.on_connection_create_start.append(on_connection_create_start)
+    config.on_connection_create_end.append(on_connection_create_end)
+    return config
@@ -0,0 +1,58 @@
+import logging
+
+from .oncall import format_timestamp, parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+# Re-list this far behind the mark, for incidents that show up in listings a little late
+OVERLAP = 60
+
+
+class Watermark:
+    """High-water mark over the ``created_at`` of listed incidents, for incremental listing.
+
+    Between full listings only incidents created since the mark are asked for. A full
+    listing runs first, then every ``full_every`` cycles, to pick up incidents that were
+    created earlier but only match now (escalated, reassigned or re-triggered to us).
+    ``full_every = 1`` lists everything every cycle.
+    """
+
+    def __init__(self, full_every: int = 1, overlap: float = OVERLAP):
+        self.full_every = full_every
+        self.overlap = overlap
+        self.mark: float | None = None
+        self._cycles = 0
+
+    def dump(self) -> dict:
+        # The cycle count is left out: it changes every cycle, so the state would always need
+        # writing. After a restart the first listing is a full one, which also picks up what
+        # changed while the daemon was down.
+        return {"mark": self.mark}
+
+    def restore(self, state: dict):
+        self.mark = state["mark"]
+
+    def since(self) -> str | None:
+        """``since`` for this cycle's listing, or None when it has to be a full one."""
+        if self.mark is None or self.full_every <= 1 or self._cycles % self.full_every == 0:
+            return None
+        return format_timestamp(self.mark - self.overlap)
+
+    def sort_by(self, since: str | None) -> str:
+        # Oldest first, so a listing cut short by a limit never moves the mark past an
+        # incident it did not return
+        return "created_at:asc" if since else "incident_number:desc"
+
+    def advance(self, incidents: list, since: str | None, truncated: bool = False):
+        """Record a listing that was acted on; call once per cycle."""
+        self._cycles += 1
+        if since is None and truncated:
+            # Newest first and cut short: older matches were never seen, keep listing everything
+            self.mark = None
+            return
+        for incident in incidents:
+            created = parse_timestamp(incident.get("created_at"), 0.0)
+            if self.mark is None or created > self.mark:
+                self.mark = created
+        if since is None and self.mark is not None:
+            logger.debug(f"Full listing done, listing incidents since {format_timestamp(self.mark)} next")
@@ -0,0 +1,162 @@
+"""PagerDuty v3 webhook receiver.
+
+Also usable as a local stand-in for PagerDuty that posts signed
+``incident.triggered`` payloads to a running receiver::
+
+    python -m pagerduty_auto_ack.webhook --url http://127.0.0.1:8080/ --secret <secret>
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = "X-PagerDuty-Signature"
+TRIGGERED_EVENT = "incident.triggered"
+
+
+def sign(secret: str, body: bytes) -> str:
+    digest = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return f"v1={digest}"
+
+
+def verify_signature(secret: str, body: bytes, header: str | None) -> bool:
+    """The header may carry several comma separated signatures while a secret is being rotated."""
+    if not header:
+        return False
+    expected = sign(secret, body)
+    return any(hmac.compare_digest(expected, sig.strip()) for sig in header.split(","))
+
+
+def parse_event(body: bytes) -> dict | None:
+    """Return the incident carried by an ``incident.triggered`` event, None for any other event.
+
+    The webhook payload is reshaped to look like an entry from the REST ``incidents`` listing,
+    so the same code can handle incidents from both sources.
+    """
+    event = json.loads(body).get("event", {})
+    if event.get("event_type") != TRIGGERED_EVENT:
+        return None
+
+    data = event.get("data", {})
+    return {
+        "id": data.get("id"),
+        "incident_number": data.get("number"),
+        "title": data.get("title"),
+        "urgency": data.get("urgency"),
+        "status": data.get("status"),
+        "created_at": data.get("created_at", event.get("occurred_at")),
+        "service": data.get("service"),
+        "teams": data.get("teams", []),
+        "priority": data.get("priority"),
+        "assignments": [{"assignee": a} for a in data.get("assignees", [])],
+    }
+
+
+def make_server(host: str, port: int, secret: str, on_incident) -> ThreadingHTTPServer:
+    """Build a receiver that calls ``on_incident(incident)`` for every verified trigger event."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length)
+
+            if not verify_signature(secret, body, self.headers.get(SIGNATURE_HEADER)):
+                logger.warning(f"Rejected webhook from {self.client_address[0]}: bad signature")
+                self._reply(401)
+                return
+
+            try:
+                incident = parse_event(body)
+            except ValueError:
+                self._reply(400)
+                return
+
+            if incident is None or not incident.get("id"):
+                self._reply(204)
+                return
+
+            try:
+                on_incident(incident)
+            except Exception:
+                # Non-2xx makes PagerDuty redeliver the event
+                logger.warning(f"Failed to handle webhook for {incident['id']}", exc_info=True)
+                self._reply(500)
+                return
+
+            self._reply(202)
+
+        def _reply(self, status: int):
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            logger.debug(f"webhook {self.address_string()} {format % args}")
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def serve_in_background(server: ThreadingHTTPServer) -> threading.Thread:
+    thread = threading.Thread(target=server.serve_forever, name="webhook", daemon=True)
+    thread.start()
+    return thread
+
+
+def build_event(incident_id: str, number: int, title: str, urgency="high", assignee_ids=[]) -> dict:
+    return {
+        "event": {
+            "id": uuid.uuid4().hex,
+            "event_type": TRIGGERED_EVENT,
+            "resource_type": "incident",
+            "occurred_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "data": {
+                "id": incident_id,
+                "type": "incident",
+                "number": number,
+                "title": title,
+                "status": "triggered",
+                "urgency": urgency,
+                "assignees": [{"id": user_id, "type": "user_reference"} for user_id in assignee_ids],
+            },
+        }
+    }
+
+
+def post_event(url: str, secret: str, event: dict) -> int:
+    body = json.dumps(event).encode()
+    request = urllib.request.Request(
+        url,
+        data=body,
+        method="POST",
+        headers={"Content-Type": "application/json", SIGNATURE_HEADER: sign(secret, body)},
+    )
+    with urllib.request.urlopen(request) as response:
+        return response.status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Post a signed incident.triggered webhook to a local receiver")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/")
+    parser.add_argument("--secret", required=True)
+    parser.add_argument("--incident-id", default="PTEST01")
+    parser.add_argument("--number", type=int, default=1)
+    parser.add_argument("--title", default="Test incident")
+    parser.add_argument("--urgency", choices=["high", "low"], default="high")
+    parser.add_argument("--assignee", action="append", default=[], dest="assignee_ids")
+    args = parser.parse_args()
+
+    event = build_event(args.incident_id, args.number, args.title, args.urgency, args.assignee_ids)
+    print(post_event(args.url, args.secret, event))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 #!/usr/bin/env bash
 
-until poetry run pagerduty-auto-ack --config config.toml --action ack; do
+until poetry run pagerduty-auto-ack --config config.toml --action ack --state-file .state-ack.json --database handled.sqlite3; do
     echo "[$(date)] Process crashed (exit code: $?), restarting in 1s..."
     sleep 1
 done
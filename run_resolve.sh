@@ -1,6 +1,6 @@
 #!/usr/bin/env bash
 
-until poetry run pagerduty-auto-ack --config config.toml --action resolve; do
+until poetry run pagerduty-auto-ack --config config.toml --action resolve --state-file .state-resolve.json --database handled.sqlite3; do
     echo "[$(date)] Process crashed (exit code: $?), restarting in 1s..."
     sleep 1
 done
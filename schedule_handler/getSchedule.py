@@ -1,20 +1,30 @@
+import argparse
+import hashlib
 import json
-import pandas as pd
-from datetime import datetime, time, date, timedelta
-from typing import List, Dict, Optional
+from datetime import date, datetime, time, timedelta
 from pathlib import Path
+from typing import Dict, List, Optional
+
 import gspread
+import numpy as np
+import pandas as pd
+from gspread.utils import absolute_range_name
 from oauth2client.service_account import ServiceAccountCredentials
 
 SERVICE_ACCOUNT_KEY_FILE = "credentials.json"
 GOOGLE_SHEET_ID = '1E91raFGsy9OfZP5J_fd0GnHQw3cKjjo8ZSpdII0zfzQ'
 SHEET_NAME = 'Orderly Mar 2026'
+# 每月一张工作表的标题格式，用于 --month 和 --discover，也用来从标题推断年份
+SHEET_TITLE_FORMAT = 'Orderly %b %Y'
 TODAY_DATE = date.today()
 TARGET_PERSON_LIST = ['allen', 'Emma', 'Tony', 'Abel']
 YEAR = 2026
 
 # 输出文件路径
 OUTPUT_FILE = Path(__file__).parent / "schedule_data.json"
+# 上次运行时表格的版本和内容哈希，没有变化时跳过下载和解析
+SYNC_STATE_FILE = Path(__file__).parent / ".schedule_sync.json"
+DRIVE_FILES_URL = "https://www.googleapis.com/drive/v3/files"
 
 # --- 定义时间范围常量和映射 ---
 TIME_RANGE_PRIMARY = (time(8, 30), time(17, 30))
@@ -27,6 +37,9 @@ TIME_RANGE_CONSTANTS = {
     "01:30~08:30 (HKT)": "TIME_RANGE_NIGHT",
 }
 
+SHIFT_ORDER = ["TIME_RANGE_PRIMARY", "TIME_RANGE_EVENING", "TIME_RANGE_NIGHT"]
+DATE_HEADER = 'Time \\ Date'
+
 SHIFTS_MAPPING = {
     "TIME_RANGE_PRIMARY": {"start": "08:30", "end": "17:30"},
     "TIME_RANGE_EVENING": {"start": "17:30", "end": "01:30"},
@@ -34,73 +47,243 @@ SHIFTS_MAPPING = {
 }
 
 
-def download_sheet_to_dataframe() -> Optional[pd.DataFrame]:
+def authorize_client():
     try:
         scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
         creds = ServiceAccountCredentials.from_json_keyfile_name(SERVICE_ACCOUNT_KEY_FILE, scope)
-        client = gspread.authorize(creds)
-
-        spreadsheet = client.open_by_key(GOOGLE_SHEET_ID)
-        worksheet = spreadsheet.worksheet(SHEET_NAME)
-
-        data = worksheet.get_all_values()
-        df = pd.DataFrame(data[1:], columns=data[0])
-        print(f"Google Sheet '{SHEET_NAME}' 下载成功。")
-        return df
-
+        return gspread.authorize(creds)
     except FileNotFoundError:
         print(f"错误：未找到密钥文件 {SERVICE_ACCOUNT_KEY_FILE}。请检查路径。")
         return None
     except Exception as e:
-        print(f"下载 Google Sheet 时发生错误: {e}")
+        print(f"Google 授权时发生错误: {e}")
         return None
 
 
-def parse_date(date_str: str) -> Optional[datetime]:
+def fetch_revision(client) -> Optional[dict]:
+    """只向 Drive 查询表格的 version 和 modifiedTime，不下载内容；查询失败时返回 None。"""
+    # gspread 6 把底层请求放在 client.http_client 上
+    http = getattr(client, "http_client", client)
     try:
-        month, day = map(int, date_str.split('/'))
-        return datetime(YEAR, month, day)
-    except:
+        response = http.request(
+            "get",
+            f"{DRIVE_FILES_URL}/{GOOGLE_SHEET_ID}",
+            params={"fields": "version,modifiedTime", "supportsAllDrives": True},
+        )
+        return response.json()
+    except Exception as e:
+        print(f"获取表格修改时间失败，改为比较表格内容: {e}")
         return None
 
 
-def process_schedule(df: pd.DataFrame, target_person: str) -> Dict[str, List[datetime]]:
-    aggregated_shifts: Dict[str, List[datetime]] = {name: [] for name in TIME_RANGE_CONSTANTS.values()}
-    date_row_indices = df[df.iloc[:, 0] == 'Time \\ Date'].index.tolist()
-    date_columns = df.columns[1:]
+def sheet_title(month: date) -> str:
+    return month.strftime(SHEET_TITLE_FORMAT)
+
 
-    for i in date_row_indices:
-        date_row = df.iloc[i]
+def month_of(title: str) -> Optional[date]:
+    """标题符合 SHEET_TITLE_FORMAT 时返回该月第一天，否则 None。"""
+    try:
+        return datetime.strptime(title.strip(), SHEET_TITLE_FORMAT).date()
+    except ValueError:
+        return None
 
-        dates: Dict[str, datetime] = {}
-        for col_name in date_columns:
-            base_date = parse_date(date_row[col_name])
-            if base_date:
-                if base_date.date() >= TODAY_DATE:
-                    dates[col_name] = base_date
 
-        if not dates:
-            continue
+def parse_months(value: str) -> List[date]:
+    """'YYYY-MM' 或 'YYYY-MM:YYYY-MM'（含两端）解析为每月第一天的列表。"""
+    first, _, last = value.partition(":")
+    try:
+        start = datetime.strptime(first, "%Y-%m").date()
+        end = datetime.strptime(last or first, "%Y-%m").date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"月份格式应为 YYYY-MM 或 YYYY-MM:YYYY-MM: {value}")
+    if end < start:
+        raise argparse.ArgumentTypeError(f"结束月份早于开始月份: {value}")
+    months = []
+    while start <= end:
+        months.append(start)
+        start = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return months
+
+
+def discover_sheets(spreadsheet) -> List[str]:
+    """表格里所有按月命名的工作表中，上个月及以后的那些（上个月的表可能排到本月初）。"""
+    this_month = TODAY_DATE.replace(day=1)
+    since = (this_month - timedelta(days=1)).replace(day=1)
+    titled = sorted((month, ws.title) for ws in spreadsheet.worksheets() if (month := month_of(ws.title)) is not None)
+    return [title for month, title in titled if month >= since]
+
+
+def download_sheets(client, titles: Optional[List[str]] = None) -> Optional[Dict[str, List[List[str]]]]:
+    """一次 values:batchGet 请求下载多张工作表，耗时与一张差不多；titles 为 None 时自动查找。
+
+    返回 {工作表标题: 行列表}，行补齐到相同长度，和 get_all_values 的结果一致。
+    """
+    try:
+        spreadsheet = client.open_by_key(GOOGLE_SHEET_ID)
+        if titles is None:
+            titles = discover_sheets(spreadsheet)
+            print(f"找到 {len(titles)} 张排班工作表: {', '.join(titles)}")
+        else:
+            # 一次 batchGet 里只要有一个标题不存在整个请求就会失败，例如 --month 包含还没建表的月份
+            existing = {ws.title for ws in spreadsheet.worksheets()}
+            for title in titles:
+                if title not in existing:
+                    print(f"警告：工作表 '{title}' 不存在，跳过。")
+            titles = [title for title in titles if title in existing]
+        if not titles:
+            return {}
+
+        response = spreadsheet.values_batch_get([absolute_range_name(title) for title in titles])
+        sheets = {}
+        for title, value_range in zip(titles, response.get("valueRanges", [])):
+            rows = value_range.get("values", [])
+            width = max(map(len, rows), default=0)
+            sheets[title] = [row + [""] * (width - len(row)) for row in rows]
+        print(f"Google Sheet {', '.join(repr(title) for title in titles)} 下载成功。")
+        return sheets
+
+    except Exception as e:
+        print(f"下载 Google Sheet 时发生错误: {e}")
+        return None
 
-        shift_data_start_index = i + 1
 
-        for j, time_desc in enumerate(TIME_RANGE_CONSTANTS.keys()):
-            shift_row_index = shift_data_start_index + j
+def download_sheet_values(client, sheet_name: str = SHEET_NAME) -> Optional[List[List[str]]]:
+    sheets = download_sheets(client, [sheet_name])
+    return sheets.get(sheet_name) if sheets is not None else None
 
-            if shift_row_index >= len(df):
-                break
 
-            shift_data = df.iloc[shift_row_index]
-            time_range_constant_name = TIME_RANGE_CONSTANTS[time_desc]
+def values_to_dataframe(data: List[List[str]]) -> pd.DataFrame:
+    return pd.DataFrame(data[1:], columns=data[0])
 
-            for col_name, base_date in dates.items():
-                person_on_shift = str(shift_data.get(col_name, '')).strip()
 
-                if person_on_shift == target_person:
-                    # NIGHT 班次 (01:30~08:30) 实际发生在列日期的下一天
-                    actual_date = base_date + timedelta(days=1) if time_range_constant_name == "TIME_RANGE_NIGHT" else base_date
-                    aggregated_shifts[time_range_constant_name].append(actual_date)
+def download_sheet_to_dataframe() -> Optional[pd.DataFrame]:
+    client = authorize_client()
+    data = download_sheet_values(client) if client is not None else None
+    return values_to_dataframe(data) if data is not None else None
+
+
+def values_hash(data) -> str:
+    return hashlib.sha256(json.dumps(data, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def sync_source(titles: Optional[List[str]] = None) -> dict:
+    """除了表格本身，输出还取决于这些设置；日期变了，已过去的班次也要从输出里去掉。
+
+    自动查找工作表时记为 None：新增或改名工作表会更新表格版本，照样会重新下载。
+    """
+    return {
+        "sheet_id": GOOGLE_SHEET_ID,
+        "sheets": titles,
+        "year": YEAR,
+        "people": TARGET_PERSON_LIST,
+        "date": TODAY_DATE.isoformat(),
+    }
 
+
+def load_sync_state() -> dict:
+    try:
+        with open(SYNC_STATE_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_sync_state(state: dict):
+    with open(SYNC_STATE_FILE, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, ensure_ascii=False)
+
+
+def parse_dates(values: np.ndarray, year: int = YEAR, month: Optional[int] = None) -> pd.DatetimeIndex:
+    """把 'M/D' 格式的日期单元格一次解析为 year 年的日期；其他格式或无效日期为 NaT。
+
+    给出工作表所属的 month 时，相差半年以上的月份算作相邻年份，
+    例如 12 月的表里排到的 1/2 是下一年。
+    """
+    parts = pd.Series(values.ravel(), dtype=object).astype(str).str.extract(r'^\s*(\d+)\s*/\s*(\d+)\s*$')
+    months = pd.to_numeric(parts[0])
+    years = np.full(len(months), year)
+    if month is not None:
+        years = years + (month - months > 6).to_numpy(dtype=int) - (months - month > 6).to_numpy(dtype=int)
+    return pd.DatetimeIndex(pd.to_datetime(
+        pd.DataFrame({"year": years, "month": months, "day": pd.to_numeric(parts[1])}),
+        errors="coerce",
+    ))
+
+
+def extract_shifts(df: pd.DataFrame, year: int = YEAR, month: Optional[int] = None) -> pd.DataFrame:
+    """把整张排班表一次展开成 (person, date, shift) 长表，只保留今天及以后的班次。
+
+    每个日期表头行（第一列为 'Time \\ Date'）下面紧跟三行班次，依次对应
+    TIME_RANGE_CONSTANTS 的顺序。所有表头块一起用 NumPy 索引取出，不逐行逐格遍历。
+    """
+    cells = df.iloc[:, 1:].to_numpy(dtype=object)
+    header_rows = np.flatnonzero(df.iloc[:, 0].to_numpy(dtype=object) == DATE_HEADER)
+    if not len(header_rows) or not cells.shape[1]:
+        return pd.DataFrame({
+            "person": pd.Series(dtype=object),
+            "date": pd.Series(dtype="datetime64[ns]"),
+            "shift": pd.Series(dtype=object),
+        })
+
+    shift_names = np.array(list(TIME_RANGE_CONSTANTS.values()))
+    # 每个表头块下面的三行班次；超出表格末尾的行丢弃
+    shift_rows = header_rows[:, None] + np.arange(1, len(shift_names) + 1)
+    block, shift = np.nonzero(shift_rows < len(df))
+
+    dates = parse_dates(cells[header_rows], year, month).to_numpy().reshape(len(header_rows), -1)
+    persons = pd.Series(cells[shift_rows[block, shift]].ravel(), dtype=object).astype(str).str.strip()
+
+    long = pd.DataFrame({
+        "person": persons.to_numpy(dtype=object),
+        "date": dates[block].ravel(),
+        "shift": np.repeat(shift_names[shift], cells.shape[1]),
+    })
+    long = long[long["date"].notna() & (long["date"] >= pd.Timestamp(TODAY_DATE)) & (long["person"] != "")]
+    # NIGHT 班次 (01:30~08:30) 实际发生在列日期的下一天
+    night = long["shift"] == "TIME_RANGE_NIGHT"
+    long.loc[night, "date"] = long.loc[night, "date"] + pd.Timedelta(days=1)
+    return long.reset_index(drop=True)
+
+
+def group_shifts(shifts: pd.DataFrame, people: List[str]) -> Dict[str, List[dict]]:
+    """按人分组一次：每人的班次按 SHIFT_ORDER、再按日期排序并去重。"""
+    shifts = shifts[shifts["person"].isin(people)].assign(
+        date=lambda d: d["date"].dt.strftime("%Y-%m-%d"),
+        order=lambda d: d["shift"].map({name: n for n, name in enumerate(SHIFT_ORDER)}),
+    )
+    shifts = shifts.drop_duplicates(["person", "date", "shift"]).sort_values(["order", "date"], kind="stable")
+    grouped = {person: group for person, group in shifts.groupby("person", sort=False)}
+    return {
+        person: grouped[person][["date", "shift"]].to_dict("records") if person in grouped else []
+        for person in people
+    }
+
+
+def extract_sheets(sheets: Dict[str, List[List[str]]]) -> pd.DataFrame:
+    """逐张展开再合并成一张长表；年份和月份取自工作表标题，不符合命名格式的用 YEAR。
+
+    相邻月份的表常有重叠的几天，重复的班次由 group_shifts 去掉。
+    """
+    frames = []
+    for title, data in sheets.items():
+        if not data:
+            print(f"工作表 '{title}' 为空，跳过。")
+            continue
+        sheet_month = month_of(title)
+        if sheet_month is not None:
+            frames.append(extract_shifts(values_to_dataframe(data), sheet_month.year, sheet_month.month))
+        else:
+            frames.append(extract_shifts(values_to_dataframe(data), YEAR))
+    if not frames:
+        return extract_shifts(pd.DataFrame({DATE_HEADER: []}))
+    return pd.concat(frames, ignore_index=True)
+
+
+def process_schedule(df: pd.DataFrame, target_person: str) -> Dict[str, List[datetime]]:
+    aggregated_shifts: Dict[str, List[datetime]] = {name: [] for name in TIME_RANGE_CONSTANTS.values()}
+    shifts = extract_shifts(df)
+    for row in shifts[shifts["person"] == target_person].itertuples(index=False):
+        aggregated_shifts[row.shift].append(row.date.to_pydatetime())
     return aggregated_shifts
 
 
@@ -111,39 +294,73 @@ def save_schedule_data(all_shifts: Dict[str, Dict[str, List[str]]]):
     print(f"排班数据已保存到 {OUTPUT_FILE}")
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(prog="get-schedule", description="从 Google Sheet 导出排班数据")
+    parser.add_argument("--force", action="store_true", help="表格没有变化时也重新下载和生成")
+    parser.add_argument(
+        "--sheet", action="append", default=[], metavar="TITLE",
+        help=f"要读取的工作表，可重复；不指定工作表和月份时读取 '{SHEET_NAME}'",
+    )
+    parser.add_argument(
+        "--month", action="append", default=[], type=parse_months, metavar="YYYY-MM[:YYYY-MM]",
+        help=f"按月份读取工作表（标题格式 '{SHEET_TITLE_FORMAT}'），可重复，可写成范围",
+    )
+    parser.add_argument(
+        "--discover", action="store_true",
+        help="读取所有按月命名、从上个月开始的工作表",
+    )
+    return parser.parse_args()
+
+
+def sheet_titles(args) -> Optional[List[str]]:
+    """命令行选中的工作表，去重并保持顺序；--discover 时返回 None，下载时再查找。"""
+    if args.discover:
+        return None
+    titles = args.sheet + [sheet_title(month) for months in args.month for month in months]
+    return list(dict.fromkeys(titles)) or [SHEET_NAME]
+
+
 def main():
-    schedule_df = download_sheet_to_dataframe()
+    args = parse_args()
+
+    client = authorize_client()
+    if client is None:
+        print("程序终止：无法获取排班数据。")
+        return
+
+    titles = sheet_titles(args)
+    state = load_sync_state()
+    source = sync_source(titles)
+    same_source = not args.force and state.get("source") == source and OUTPUT_FILE.exists()
+
+    # 先取版本再下载：下载期间的修改会让下次运行看到新版本，不会被漏掉
+    revision = fetch_revision(client)
+    if same_source and revision is not None and revision == state.get("revision"):
+        print(f"表格自上次运行以来没有修改（{revision.get('modifiedTime')}），跳过。")
+        return
 
-    if schedule_df is None:
+    sheets = download_sheets(client, titles)
+    if sheets is None:
         print("程序终止：无法获取排班数据。")
         return
 
-    all_shifts = {}
-
-    for target_person in TARGET_PERSON_LIST:
-        aggregated_shifts = process_schedule(schedule_df, target_person)
-
-        # 转换为可序列化的格式：每条记录包含日期和班次类型
-        person_shifts = []
-        seen = set()
-        for constant_name in ["TIME_RANGE_PRIMARY", "TIME_RANGE_EVENING", "TIME_RANGE_NIGHT"]:
-            shifts_list = sorted(aggregated_shifts.get(constant_name, []))
-            for date_obj in shifts_list:
-                key = (date_obj.strftime("%Y-%m-%d"), constant_name)
-                if key not in seen:
-                    seen.add(key)
-                    person_shifts.append({
-                        "date": date_obj.strftime("%Y-%m-%d"),
-                        "shift": constant_name,
-                    })
-
-        all_shifts[target_person] = person_shifts
+    # 其他工作表或格式的修改也会更新版本，内容哈希相同就不必重新解析
+    digest = values_hash(sheets)
+    if same_source and digest == state.get("hash"):
+        print("排班内容没有变化，跳过解析和写入。")
+        save_sync_state({**state, "revision": revision})
+        return
+
+    # 每张表只展开一次，合并后再按人分组，耗时只随表格大小增长，与名单长度无关
+    all_shifts = group_shifts(extract_sheets(sheets), TARGET_PERSON_LIST)
+    for target_person, person_shifts in all_shifts.items():
         print(f"{target_person}: {len(person_shifts)} 个班次")
 
     # 附加班次时间映射，供 overrideSchedule 使用
     all_shifts["_shifts_mapping"] = SHIFTS_MAPPING
 
     save_schedule_data(all_shifts)
+    save_sync_state({"source": source, "revision": revision, "hash": digest})
 
 
 if __name__ == '__main__':
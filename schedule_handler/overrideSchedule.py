@@ -1,10 +1,14 @@
 import json
 import tomllib
-import requests
 from datetime import datetime, time, timedelta, timezone
 from pathlib import Path
 from typing import Optional
 
+import requests
+from urllib3.util import Retry
+
+from pagerduty_auto_ack.governor import GovernedAdapter, Governors
+
 TZ_UTC_PLUS_8 = timezone(timedelta(hours=8))
 BASE_URL = "https://api.pagerduty.com"
 API_VERSION_HEADER = "application/vnd.pagerduty+json;version=2"
@@ -12,6 +16,13 @@ API_VERSION_HEADER = "application/vnd.pagerduty+json;version=2"
 SCHEDULE_DATA_FILE = Path(__file__).parent / "schedule_data.json"
 CONFIG_FILE = Path(__file__).parent.parent / "config.toml"
 
+# 连接失败时请求还没发到 PagerDuty，重发是安全的（POST 也一样）；这个客户端不经过 RetryPolicy，只在这里重试
+CONNECT_RETRIES = Retry(connect=3, read=0, redirect=0, status=0, other=0, backoff_factor=0.5)
+
+# 所有请求共用一个 keep-alive 连接池（带超时和连接重试），并经过限流器，避免批量同步 override 时触发 429
+SESSION = requests.Session()
+SESSION.mount("https://", GovernedAdapter(Governors(), max_retries=CONNECT_RETRIES))
+
 
 def load_config() -> dict:
     """从 config.toml 加载配置。"""
@@ -34,7 +45,7 @@ def make_headers(api_key: str) -> dict:
 def lookup_user_id(headers: dict, name: str) -> Optional[str]:
     """通过 PagerDuty API 按名字查找用户 ID。"""
     try:
-        response = requests.get(
+        response = SESSION.get(
             f"{BASE_URL}/users",
             headers=headers,
             params={"query": name},
@@ -68,12 +79,13 @@ def parse_time(time_str: str) -> time:
 def delete_single_override(headers: dict, schedule_id: str, override_id: str) -> bool:
     url = f"{BASE_URL}/schedules/{schedule_id}/overrides/{override_id}"
     try:
-        response = requests.delete(url, headers=headers)
+        response = SESSION.delete(url, headers=headers)
         if response.status_code in (200, 204):
             print(f"   [OK] 覆盖 {override_id} 已删除。")
             return True
         else:
             response.raise_for_status()
+            return False
     except requests.exceptions.HTTPError as err:
         print(f"   [ERROR] 删除 {override_id} 失败: {err}")
         return False
@@ -96,7 +108,7 @@ def delete_all_future_overrides(headers: dict, schedule_id: str, lookahead_days=
     print(f"--- 正在获取排班表 {schedule_id} 的未来覆盖记录 ---")
 
     try:
-        response = requests.get(list_url, headers=headers, params=params)
+        response = SESSION.get(list_url, headers=headers, params=params)
         response.raise_for_status()
         overrides = response.json().get('overrides', [])
 
@@ -137,7 +149,7 @@ def create_override(headers: dict, schedule_id: str, user_id: str,
     print(f"-> 创建覆盖: {start_iso} - {end_iso}")
 
     try:
-        response = requests.post(url, headers=headers, data=json.dumps(payload))
+        response = SESSION.post(url, headers=headers, data=json.dumps(payload))
         response.raise_for_status()
         print(f"   成功 (ID: {response.json()['override']['id']})")
         return True
@@ -146,7 +158,7 @@ def create_override(headers: dict, schedule_id: str, user_id: str,
         try:
             error_details = response.json().get('error', {}).get('message', response.text)
             print(f"   详细错误: {error_details}")
-        except:
+        except ValueError:
             print(f"   详细错误: {response.text}")
         return False
     except Exception as e:
@@ -0,0 +1,218 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from pagerduty_auto_ack import retry
+from pagerduty_auto_ack.retry import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryPolicy,
+)
+from pagerduty_auto_ack.transport import DEADLINE, capped_timeout
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, headers: dict | None = None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.headers = headers or {}
+
+
+class Clock:
+    """Stands in for the ``time`` module in retry.py: sleeping only moves the clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+
+class Calls:
+    """``fn`` for RetryPolicy.call: raises the given errors in turn, then returns "ok"."""
+
+    def __init__(self, *errors, clock: Clock | None = None, duration: float = 0.0):
+        self.errors = list(errors)
+        self.clock = clock
+        self.duration = duration
+        self.count = 0
+        self.deadlines: list[float | None] = []
+
+    def __call__(self):
+        self.count += 1
+        if self.clock is not None:
+            self.clock.sleep(self.duration)
+        self.deadlines.append(DEADLINE.get())
+        if self.errors:
+            error = self.errors.pop(0)
+            if error is not None:
+                raise error
+        return "ok"
+
+
+class RetryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch.object(retry, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def policy(self, attempts=4, delay=0.5, threshold=5, cooldown=5.0) -> RetryPolicy:
+        policy = RetryPolicy(attempts=attempts, breaker=CircuitBreaker(threshold=threshold, cooldown=cooldown))
+        patcher = mock.patch.object(policy, "delay", return_value=delay)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return policy
+
+
+class RetryPolicyTest(RetryTestCase):
+    def test_server_errors_are_retried(self):
+        calls = Calls(HTTPError(502), ConnectionError())
+        self.assertEqual(self.policy().call("GET /incidents", calls, self.clock.now + 60), "ok")
+        self.assertEqual(calls.count, 3)
+
+    def test_client_errors_are_not_retried(self):
+        calls = Calls(HTTPError(404))
+        with self.assertRaises(HTTPError):
+            self.policy().call("GET /incidents", calls, self.clock.now + 60)
+        self.assertEqual(calls.count, 1)
+
+    def test_other_errors_are_not_retried(self):
+        calls = Calls(KeyError("incidents"))
+        with self.assertRaises(KeyError):
+            self.policy().call("GET /incidents", calls, self.clock.now + 60)
+        self.assertEqual(calls.count, 1)
+
+    def test_gives_up_after_attempts(self):
+        calls = Calls(*[HTTPError(500)] * 10)
+        with self.assertRaises(HTTPError):
+            self.policy(attempts=3).call("GET /incidents", calls, self.clock.now + 60)
+        self.assertEqual(calls.count, 3)
+
+    def test_no_retry_without_room_before_the_deadline(self):
+        # Every attempt takes 1s; after the first one 0.5s delay + MIN_ATTEMPT still fit, after the second not
+        calls = Calls(*[HTTPError(503)] * 10, clock=self.clock, duration=1.0)
+        start = self.clock.now
+        with self.assertRaises(HTTPError):
+            self.policy(attempts=10).call("GET /incidents", calls, start + 3.2)
+        self.assertEqual(calls.count, 2)
+        self.assertLessEqual(self.clock.now, start + 3.2)
+
+    def test_only_retries_are_held_to_the_deadline(self):
+        calls = Calls(HTTPError(503))
+        deadline = self.clock.now + 60
+        self.policy().call("GET /incidents", calls, deadline)
+        self.assertEqual(calls.deadlines, [None, deadline])
+        self.assertIsNone(DEADLINE.get())
+
+    def test_async_retries(self):
+        calls = Calls(HTTPError(502))
+
+        async def fn():
+            return calls()
+
+        result = asyncio.run(self.policy(delay=0).call_async("PUT /incidents", fn, self.clock.now + 60))
+        self.assertEqual((result, calls.count), ("ok", 2))
+
+    def test_rate_limited_retried_after_retry_after(self):
+        calls = Calls(HTTPError(429, {"retry-after": "2"}), clock=self.clock)
+        start = self.clock.now
+        self.assertEqual(self.policy(delay=0.5).call("GET /incidents", calls, start + 60), "ok")
+        self.assertEqual((calls.count, self.clock.now), (2, start + 2))
+
+    def test_retry_in(self):
+        policy = self.policy(threshold=1, cooldown=5)
+        self.assertEqual(policy.retry_in(60, HTTPError(503)), 5)
+        policy.breaker.record_failure()
+        self.clock.sleep(2)
+        self.assertEqual(policy.retry_in(60, CircuitOpenError()), 3)
+
+    def test_persistent_client_errors_wait_the_full_interval(self):
+        policy = self.policy(threshold=2, cooldown=5)
+        for _ in range(10):
+            with self.assertRaises(HTTPError):
+                policy.call("GET /incidents", Calls(HTTPError(403)), self.clock.now + 60)
+            self.assertEqual(policy.retry_in(60, HTTPError(403)), 60)
+        self.assertEqual(policy.retry_in(60, HTTPError(429)), 60)
+        self.assertEqual(policy.retry_in(60, KeyError("incidents")), 60)
+        self.assertEqual(policy.breaker.state, CLOSED)
+
+
+class CircuitBreakerTest(RetryTestCase):
+    def test_open_half_open_closed(self):
+        policy = self.policy(attempts=1, threshold=2, cooldown=5)
+        breaker = policy.breaker
+        for _ in range(2):
+            with self.assertRaises(HTTPError):
+                policy.call("GET /incidents", Calls(HTTPError(500)), self.clock.now + 60)
+        self.assertEqual(breaker.state, OPEN)
+
+        # Open: fail fast without calling the API
+        calls = Calls()
+        with self.assertRaises(CircuitOpenError):
+            policy.call("GET /incidents", calls, self.clock.now + 60)
+        self.assertEqual(calls.count, 0)
+
+        # Half-open after the cooldown: a single probe at a time
+        self.clock.sleep(5)
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertFalse(breaker.allow())
+
+        # A failed probe opens it again for twice as long
+        breaker.record_failure()
+        self.assertEqual((breaker.state, breaker.cooldown), (OPEN, 10))
+        self.clock.sleep(5)
+        self.assertFalse(breaker.allow())
+        self.clock.sleep(5)
+
+        # A successful probe closes it and resets the cooldown
+        self.assertEqual(policy.call("GET /incidents", Calls(), self.clock.now + 60), "ok")
+        self.assertEqual((breaker.state, breaker.cooldown), (CLOSED, 5))
+
+    def test_cooldown_is_capped(self):
+        breaker = CircuitBreaker(threshold=1, cooldown=5, max_cooldown=12)
+        breaker.record_failure()
+        for _ in range(3):
+            self.clock.sleep(breaker.cooldown)
+            self.assertTrue(breaker.allow())
+            breaker.record_failure()
+        self.assertEqual(breaker.cooldown, 12)
+
+    def test_client_errors_do_not_count(self):
+        policy = self.policy(attempts=1, threshold=1)
+        with self.assertRaises(HTTPError):
+            policy.call("PUT /incidents", Calls(HTTPError(400)), self.clock.now + 60)
+        self.assertEqual(policy.breaker.state, CLOSED)
+
+    def test_client_errors_are_not_a_successful_probe(self):
+        policy = self.policy(attempts=1, threshold=1, cooldown=5)
+        with self.assertRaises(HTTPError):
+            policy.call("GET /incidents", Calls(HTTPError(500)), self.clock.now + 60)
+        self.clock.sleep(5)
+        with self.assertRaises(HTTPError):
+            policy.call("GET /incidents", Calls(HTTPError(401)), self.clock.now + 60)
+        # Still half-open, and the next request is let through as a probe again
+        self.assertEqual(policy.breaker.state, HALF_OPEN)
+        self.assertEqual(policy.call("GET /incidents", Calls(), self.clock.now + 60), "ok")
+        self.assertEqual(policy.breaker.state, CLOSED)
+
+
+class CappedTimeoutTest(unittest.TestCase):
+    def test_capped_to_the_deadline(self):
+        with mock.patch("pagerduty_auto_ack.transport.time.monotonic", return_value=100.0):
+            self.assertEqual(capped_timeout((5.0, 30.0), None), (5.0, 30.0))
+            self.assertEqual(capped_timeout((5.0, 30.0), 110.0), (5.0, 10.0))
+            self.assertEqual(capped_timeout(30.0, 103.0), 3.0)
+            # Never below MIN_TIMEOUT, even past the deadline
+            self.assertEqual(capped_timeout((5.0, 30.0), 90.0), (1.0, 1.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+import unittest
+
+from pagerduty_auto_ack import daemon
+from pagerduty_auto_ack.history import History
+from pagerduty_auto_ack.rules import Matcher
+
+
+def incident(id="PINC1", status="triggered", urgency="high", service="PSVC1", teams=(), priority=None, title=""):
+    return {
+        "id": id,
+        "status": status,
+        "urgency": urgency,
+        "service": {"id": service},
+        "teams": [{"id": team} for team in teams],
+        "priority": priority,
+        "title": title,
+    }
+
+
+def config(action="ack", rules=[], urgencies=[], actions={}):
+    return {"action": action, "rules": rules, "urgencies": urgencies, "actions": actions}
+
+
+def routes_of(cfg: dict) -> list:
+    return daemon.make_routes(cfg, {action: History(10) for action in daemon.actions_of(cfg)})
+
+
+class MatcherTest(unittest.TestCase):
+    def test_no_rules_match_everything(self):
+        self.assertTrue(Matcher([]).matches(incident()))
+        self.assertEqual(Matcher([]).pushdown(), {})
+
+    def test_single_condition_rules(self):
+        matcher = Matcher([{"services": ["PSVC1"]}, {"teams": "PTEAM1"}, {"priorities": ["P1"]}, {"title": "disk"}])
+        self.assertTrue(matcher.matches(incident(service="PSVC1")))
+        self.assertTrue(matcher.matches(incident(service="PSVC2", teams=["PTEAM0", "PTEAM1"])))
+        self.assertTrue(matcher.matches(incident(service="PSVC2", priority={"summary": "P1", "id": "PPRI"})))
+        self.assertTrue(matcher.matches(incident(service="PSVC2", title="/var: disk full")))
+        self.assertFalse(matcher.matches(incident(service="PSVC2", teams=["PTEAM0"], title="cpu")))
+
+    def test_priority_by_id(self):
+        matcher = Matcher([{"priorities": ["PPRI1"]}])
+        self.assertTrue(matcher.matches(incident(priority={"summary": "P1", "id": "PPRI1"})))
+        self.assertFalse(matcher.matches(incident(priority=None)))
+
+    def test_all_conditions_of_a_rule_must_hold(self):
+        matcher = Matcher([{"services": ["PSVC1"], "urgencies": ["high"]}, {"teams": ["PTEAM1"], "title": "^db"}])
+        self.assertTrue(matcher.matches(incident(service="PSVC1", urgency="high")))
+        self.assertFalse(matcher.matches(incident(service="PSVC1", urgency="low")))
+        self.assertTrue(matcher.matches(incident(service="PSVC2", teams=["PTEAM1"], title="db down")))
+        self.assertFalse(matcher.matches(incident(service="PSVC2", teams=["PTEAM1"], title="web down")))
+
+    def test_title_regexes_are_combined(self):
+        matcher = Matcher([{"title": "(?i)^disk"}, {"title": "full$"}])
+        self.assertTrue(matcher.matches(incident(title="DISK almost")))
+        self.assertTrue(matcher.matches(incident(title="queue full")))
+        self.assertFalse(matcher.matches(incident(title="cpu")))
+
+    def test_bad_rules_are_rejected(self):
+        for rules in (
+            {"services": ["PSVC1"]},
+            [["PSVC1"]],
+            [{"service": ["PSVC1"]}],
+            [{"title": "("}],
+            [{"services": []}],
+            [{"urgencies": "high", "teams": []}],
+            [{"services": 5}],
+            [{"title": 5}],
+        ):
+            with self.subTest(rules=rules), self.assertRaises(ValueError):
+                Matcher(rules)
+
+    def test_pushdown_only_fields_every_rule_restricts(self):
+        matcher = Matcher([{"services": ["PSVC1"], "urgencies": ["high"]}, {"services": ["PSVC2"]}])
+        self.assertEqual(matcher.pushdown(), {"services": {"PSVC1", "PSVC2"}})
+
+
+class RoutingTest(unittest.TestCase):
+    def test_first_matching_route_wins(self):
+        routes = routes_of(config(action=["ack", "resolve"]))
+        triggered, acknowledged, resolved = (
+            incident("PINC1"),
+            incident("PINC2", status="acknowledged"),
+            incident("PINC3", status="resolved"),
+        )
+        routed = daemon.route_incidents(routes, [triggered, acknowledged, resolved])
+        self.assertEqual([(route.action, incidents) for route, incidents in routed], [
+            ("ack", [triggered]),
+            ("resolve", [acknowledged]),
+        ])
+
+    def test_routes_apply_their_own_rules_and_urgencies(self):
+        cfg = config(
+            action=["resolve", "ack"],
+            actions={"resolve": {"rules": [{"priorities": ["P5"]}], "urgencies": ["low"]}},
+        )
+        low_p5 = incident("PINC1", urgency="low", priority={"summary": "P5"})
+        high_p5 = incident("PINC2", urgency="high", priority={"summary": "P5"})
+        routed = daemon.route_incidents(routes_of(cfg), [low_p5, high_p5])
+        self.assertEqual([(route.action, incidents) for route, incidents in routed], [
+            ("resolve", [low_p5]),
+            ("ack", [high_p5]),
+        ])
+
+
+class ListingTest(unittest.TestCase):
+    def test_statuses_cover_every_route(self):
+        self.assertEqual(daemon.listing_params(routes_of(config(action="ack")))["statuses"], ["triggered"])
+        self.assertEqual(
+            daemon.listing_params(routes_of(config(action="resolve")))["statuses"], ["triggered", "acknowledged"]
+        )
+
+    def test_filters_pushed_down_when_every_route_restricts_them(self):
+        cfg = config(
+            action=["ack", "resolve"],
+            urgencies=["high"],
+            rules=[{"services": ["PSVC1"]}],
+            actions={"resolve": {"rules": [{"services": ["PSVC2"], "teams": ["PTEAM1"]}]}},
+        )
+        params = daemon.listing_params(routes_of(cfg))
+        self.assertEqual(params["urgencies"], ["high"])
+        self.assertEqual(params["service_ids"], ["PSVC1", "PSVC2"])
+        # Only the resolve route restricts teams
+        self.assertEqual(params["team_ids"], [])
+
+    def test_nothing_pushed_down_when_a_route_takes_everything(self):
+        cfg = config(
+            action=["ack", "resolve"],
+            actions={"ack": {"urgencies": ["high"], "rules": [{"services": ["PSVC1"]}]}},
+        )
+        params = daemon.listing_params(routes_of(cfg))
+        self.assertEqual(
+            params,
+            {"statuses": ["triggered", "acknowledged"], "service_ids": [], "team_ids": [], "urgencies": []},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
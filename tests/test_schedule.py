@@ -0,0 +1,109 @@
+import unittest
+from datetime import date
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+try:
+    from schedule_handler import getSchedule
+except ImportError:  # gspread / oauth2client not installed
+    getSchedule = None  # type: ignore[assignment]
+
+# One month's sheet as gspread returns it: a title row, then blocks of a date header and the
+# three shifts in TIME_RANGE_CONSTANTS order. The second block is cut short after two shifts.
+SHEET = [
+    ["Orderly Mar 2026", "", "", ""],
+    ["Time \\ Date", "2/28", "3/1", "3/2"],
+    ["8:30~17:30 (HKT)", "allen", "Emma", " Tony "],
+    ["17:30~01:30 (HKT)", "Emma", "", "allen"],
+    ["01:30~08:30 (HKT)", "Tony", "Abel", "Emma"],
+    ["Time \\ Date", "3/2", "3/3", "TBD"],
+    ["8:30~17:30 (HKT)", "Tony", "allen", "Abel"],
+    ["17:30~01:30 (HKT)", "allen", "Bob", "Emma"],
+]
+
+
+@unittest.skipIf(getSchedule is None, "gspread and oauth2client are not installed")
+class ExtractShiftsTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(getSchedule, "TODAY_DATE", date(2026, 3, 1))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def shifts(self) -> pd.DataFrame:
+        return getSchedule.extract_shifts(getSchedule.values_to_dataframe(SHEET), 2026, 3)
+
+    def test_extract_shifts(self):
+        shifts = self.shifts()
+        rows = [(row.person, row.date.strftime("%m-%d"), row.shift) for row in shifts.itertuples(index=False)]
+        # Past days, empty cells and dates that do not parse are dropped; night shifts move to the next day
+        self.assertEqual(rows, [
+            ("Emma", "03-01", "TIME_RANGE_PRIMARY"),
+            ("Tony", "03-02", "TIME_RANGE_PRIMARY"),
+            ("allen", "03-02", "TIME_RANGE_EVENING"),
+            ("Abel", "03-02", "TIME_RANGE_NIGHT"),
+            ("Emma", "03-03", "TIME_RANGE_NIGHT"),
+            ("Tony", "03-02", "TIME_RANGE_PRIMARY"),
+            ("allen", "03-03", "TIME_RANGE_PRIMARY"),
+            ("allen", "03-02", "TIME_RANGE_EVENING"),
+            ("Bob", "03-03", "TIME_RANGE_EVENING"),
+        ])
+
+    def test_group_shifts(self):
+        grouped = getSchedule.group_shifts(self.shifts(), ["allen", "Emma", "Tony", "Abel", "Nobody"])
+        self.assertEqual(grouped, {
+            "allen": [
+                {"date": "2026-03-03", "shift": "TIME_RANGE_PRIMARY"},
+                {"date": "2026-03-02", "shift": "TIME_RANGE_EVENING"},
+            ],
+            "Emma": [
+                {"date": "2026-03-01", "shift": "TIME_RANGE_PRIMARY"},
+                {"date": "2026-03-03", "shift": "TIME_RANGE_NIGHT"},
+            ],
+            "Tony": [{"date": "2026-03-02", "shift": "TIME_RANGE_PRIMARY"}],
+            "Abel": [{"date": "2026-03-02", "shift": "TIME_RANGE_NIGHT"}],
+            "Nobody": [],
+        })
+
+    def test_no_date_headers(self):
+        shifts = getSchedule.extract_shifts(getSchedule.values_to_dataframe(SHEET[:1] + SHEET[2:5]))
+        self.assertEqual(list(shifts.columns), ["person", "date", "shift"])
+        self.assertTrue(shifts.empty)
+
+    def test_dates_next_to_the_sheet_month_roll_over_the_year(self):
+        dates = getSchedule.parse_dates(np.array(["12/30", "1/2", "13/1"], dtype=object), 2026, 12)
+        self.assertEqual(list(dates[:2].strftime("%Y-%m-%d")), ["2026-12-30", "2027-01-02"])
+        self.assertTrue(pd.isna(dates[2]))
+
+
+
+class Spreadsheet:
+    """The two gspread calls download_sheets makes, on a spreadsheet with the given worksheets."""
+
+    def __init__(self, *titles):
+        self.titles = titles
+        self.requested = []
+
+    def worksheets(self):
+        return [SimpleNamespace(title=title) for title in self.titles]
+
+    def values_batch_get(self, ranges):
+        self.requested.append(ranges)
+        return {"valueRanges": [{"values": [["a"], ["b", "c"]]} for _ in ranges]}
+
+
+@unittest.skipIf(getSchedule is None, "gspread and oauth2client are not installed")
+class DownloadSheetsTest(unittest.TestCase):
+    def test_missing_sheets_are_skipped(self):
+        spreadsheet = Spreadsheet("Orderly Mar 2026", "Notes")
+        client = SimpleNamespace(open_by_key=lambda key: spreadsheet)
+        with mock.patch("builtins.print"):
+            sheets = getSchedule.download_sheets(client, ["Orderly Mar 2026", "Orderly Apr 2026"])
+        self.assertEqual(sheets, {"Orderly Mar 2026": [["a", ""], ["b", "c"]]})
+        self.assertEqual(spreadsheet.requested, [["'Orderly Mar 2026'"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
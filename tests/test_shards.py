@@ -0,0 +1,101 @@
+import unittest
+from types import SimpleNamespace
+
+from pagerduty_auto_ack import daemon
+from pagerduty_auto_ack.shards import CATCH_ALL_LIMIT, MAX_IDS, Shards
+
+
+def incident(id, service=None, teams=(), created_at="2026-01-01T00:00:00Z"):
+    return {
+        "id": id,
+        "service": {"id": service} if service else None,
+        "teams": [{"id": team} for team in teams],
+        "created_at": created_at,
+    }
+
+
+def poller(shards: Shards, shard: int, ids=(), limit=None):
+    return SimpleNamespace(
+        shards=shards,
+        shard=shard,
+        listing={"statuses": ["triggered"], shards.param: list(ids), "urgencies": []},
+        cfg={"max_incidents_per_cycle": limit},
+    )
+
+
+class ShardsTest(unittest.TestCase):
+    def setUp(self):
+        self.shards = Shards("service", 4)
+        self.shards.load([f"PSVC{n:03d}" for n in range(1000)])
+
+    def test_ids_are_listed_in_bounded_chunks(self):
+        listings = daemon.shard_listings(poller(self.shards, 1))
+        chunks = [filters["service_ids"] for filters, _, _ in listings]
+        self.assertTrue(all(0 < len(chunk) <= MAX_IDS for chunk in chunks))
+        self.assertEqual(sorted(sum(chunks, [])), self.shards.partition(1))
+
+    def test_only_shard_0_lists_the_catch_all(self):
+        catch_all = [
+            [(filters["service_ids"], limit) for filters, limit, catch_all in listings if catch_all]
+            for listings in (daemon.shard_listings(poller(self.shards, index)) for index in range(4))
+        ]
+        self.assertEqual(catch_all, [[([], CATCH_ALL_LIMIT)], [], [], []])
+        # Nothing to catch when the rules name the services
+        self.assertFalse(any(listing[2] for listing in daemon.shard_listings(poller(self.shards, 0, ["PSVC001"]))))
+
+    def test_every_incident_has_exactly_one_owner(self):
+        incidents = [
+            incident("PINC1", service="PSVC001"),
+            incident("PINC2", service="PSVC002"),
+            incident("PINC3", service="PSVCNEW"),
+            incident("PINC4"),
+        ]
+        owners = {
+            incident["id"]: index
+            for index in range(4)
+            for incident in self.shards.owned(index, incidents)
+        }
+        self.assertEqual(set(owners), {"PINC1", "PINC2", "PINC3", "PINC4"})
+        self.assertEqual((owners["PINC3"], owners["PINC4"]), (0, 0))
+
+    def test_lowest_known_team_owns(self):
+        shards = Shards("team", 4)
+        shards.load(["PTEAM1", "PTEAM2"])
+        both = incident("PINC1", teams=["PTEAM0", "PTEAM2", "PTEAM1"])
+        self.assertEqual([i for i in range(4) if shards.owned(i, [both])], [shards.shard_of("PTEAM1")])
+
+    def test_unknown_ids_bring_the_refresh_forward(self):
+        self.assertFalse(self.shards.claim_refresh())
+        self.shards.owned(0, [incident("PINC1")])
+        self.assertFalse(self.shards._expired)
+        self.shards.owned(0, [incident("PINC1", service="PSVCNEW")])
+        self.assertTrue(self.shards._expired)
+
+
+class MergeListingsTest(unittest.TestCase):
+    def test_duplicates_dropped_and_mark_held_at_a_cut_short_listing(self):
+        shards = Shards("service", 1)
+        shards.load(["PSVC1", "PSVC2"])
+        listings = [({}, 2, False), ({}, 2, False)]
+        first = [
+            incident("PINC1", "PSVC1", created_at="2026-01-01T00:00:01Z"),
+            incident("PINC2", "PSVC1", created_at="2026-01-01T00:00:02Z"),
+        ]
+        second = [incident("PINC3", "PSVC2", created_at="2026-01-01T00:00:03Z")]
+        listed, marked, truncated = daemon.merge_listings(
+            poller(shards, 0), listings, [first, first[:1] + second], "2026-01-01T00:00:00Z"
+        )
+        self.assertEqual([i["id"] for i in listed], ["PINC1", "PINC2", "PINC3"])
+        self.assertEqual([i["id"] for i in marked], ["PINC1", "PINC2"])
+        self.assertFalse(truncated)
+
+    def test_only_a_cut_short_full_listing_counts_as_truncated(self):
+        shards = Shards("service", 1)
+        full = [incident(f"PINC{n}", "PSVC1") for n in range(3)]
+        catch_all = [({}, None, False), ({}, 3, True)]
+        self.assertFalse(daemon.merge_listings(poller(shards, 0), catch_all, [full, full], None)[2])
+        self.assertTrue(daemon.merge_listings(poller(shards, 0), [({}, 3, False)], [full], None)[2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from pagerduty_auto_ack import daemon
+from pagerduty_auto_ack.history import History, RecentIds
+from pagerduty_auto_ack.oncall import OncallWindows
+from pagerduty_auto_ack.state import StateFile
+from pagerduty_auto_ack.watermark import Watermark
+
+
+def poller(state: StateFile):
+    return SimpleNamespace(
+        cfg={"pagerduty_api_key": "key", "action": "ack"},
+        shards=None,
+        shard=0,
+        schedule_ids=[],
+        watermark=Watermark(full_every=10),
+        windows=OncallWindows(),
+        recent=RecentIds(),
+        routes=[SimpleNamespace(action="ack", history=History(10))],
+        state=state,
+        tag="",
+    )
+
+
+class SaveStateTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        self.addCleanup(os.unlink, self.path)
+
+    def test_written_only_when_something_changed(self):
+        p = poller(StateFile(self.path))
+        p.recent.add(["PINC1"], "ack")
+        incident = {"id": "PINC1", "created_at": "2026-01-01T00:00:00Z"}
+        p.watermark.advance([incident], None)
+        daemon.save_state(p)
+
+        # Quiet cycles: only the cycle count moves
+        for _ in range(3):
+            p.watermark.advance([], "2026-01-01T00:00:00Z")
+            os.utime(self.path, ns=(0, 0))
+            daemon.save_state(p)
+            self.assertEqual(os.stat(self.path).st_mtime_ns, 0)
+
+        p.watermark.advance([{"id": "PINC2", "created_at": "2026-01-01T00:01:00Z"}], "2026-01-01T00:00:00Z")
+        daemon.save_state(p)
+        self.assertNotEqual(os.stat(self.path).st_mtime_ns, 0)
+
+    def test_restart_starts_with_a_full_listing(self):
+        p = poller(StateFile(self.path))
+        p.watermark.advance([{"id": "PINC1", "created_at": "2026-01-01T00:00:00Z"}], None)
+        self.assertIsNotNone(p.watermark.since())
+        daemon.save_state(p)
+
+        state = StateFile(self.path)
+        state.load()
+        restarted = poller(state)
+        daemon.restore_state(restarted, state)
+        self.assertEqual(restarted.watermark.mark, p.watermark.mark)
+        self.assertIsNone(restarted.watermark.since())
+
+
+if __name__ == "__main__":
+    unittest.main()